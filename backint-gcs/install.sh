@@ -11,6 +11,11 @@ readonly LOGS_DIR="$INSTALL_DESTINATION/logs"
 readonly LOGGING_PROPERTIES="$INSTALL_DESTINATION/logging.properties"
 readonly PARAMETERS_FILE="$INSTALL_DESTINATION/parameters.txt"
 readonly UPDATE_LOCK="$INSTALL_DESTINATION/.updating.lock"
+readonly UPDATE_JOB="$INSTALL_DESTINATION/update"
+readonly UPDATE_INTERVAL="$INSTALL_DESTINATION/UPDATE_INTERVAL.txt"
+readonly LATEST_CACHE="$INSTALL_DESTINATION/.latest"
+readonly DEFAULT_UPDATE_INTERVAL=86400
+readonly DEFAULT_CHUNK_SIZE_MB=100
 
 download () {
     # Downloads and unzips the archive from GCS
@@ -52,33 +57,109 @@ EOF
           "<path_to_creds> to \"$PARAMETERS_FILE\""
 }
 
+time_startup() {
+    # Prints the average wall time, in ms, of three short backint runs that read no input
+    # $@ - additional JVM options
+    local jar="$(ls $INSTALL_DESTINATION/*$version.jar)"
+    local start end total=0 run
+    for run in 1 2 3
+    do
+        start=$(date +%s%N)
+        timeout 120 "$INSTALL_DESTINATION/jre/bin/java" "$@" -jar "$jar" -u "$SAPSYSTEMNAME" \
+            -f backup -t file -l LOG -c 1 -p "$PARAMETERS_FILE" -i /dev/null -o /dev/null \
+            > /dev/null 2>&1 || true
+        end=$(date +%s%N)
+        total=$(( total + (end - start) / 1000000 ))
+    done
+    echo $(( total / 3 ))
+}
+
+create_cds_archive() {
+    # Creates an AppCDS archive of the classes loaded by a short backint run, so that each call
+    # maps them instead of loading and verifying them again. Dynamic archiving needs JDK 13+;
+    # older JDKs are tried with a class list. The archive is removed if the JVM can't use it
+    # $1 - latest version number
+    local archive="$INSTALL_DESTINATION/backint-$version.jsa"
+    local classes="$INSTALL_DESTINATION/backint-$version.classlist"
+    local jar="$(ls $INSTALL_DESTINATION/*$version.jar)"
+    local before after
+
+    rm -f "$INSTALL_DESTINATION"/backint-*.jsa "$INSTALL_DESTINATION"/backint-*.classlist
+    before="$(time_startup -XX:TieredStopAtLevel=1 -XX:+UseSerialGC)"
+
+    time_startup -XX:ArchiveClassesAtExit="$archive" > /dev/null
+    if [[ ! -s "$archive" ]]
+    then
+        time_startup -Xshare:off -XX:DumpLoadedClassList="$classes" > /dev/null
+        "$INSTALL_DESTINATION/jre/bin/java" -Xshare:dump -XX:SharedClassListFile="$classes" \
+            -XX:SharedArchiveFile="$archive" -cp "$jar" > /dev/null 2>&1 || true
+        rm -f "$classes"
+    fi
+    if [[ ! -s "$archive" ]] || ! "$INSTALL_DESTINATION/jre/bin/java" -Xshare:on \
+        -XX:SharedArchiveFile="$archive" -cp "$jar" -version > /dev/null 2>&1
+    then
+        rm -f "$archive"
+        echo "$(date +'%Y-%m-%d %H:%M:%S %Z') - Class data sharing is not supported by the" \
+            "bundled JRE. Startup ${before}ms" >> "$LOGS_DIR/installation.log"
+        return 0
+    fi
+    chmod 0644 "$archive"
+
+    after="$(time_startup -XX:TieredStopAtLevel=1 -XX:+UseSerialGC \
+        -XX:SharedArchiveFile="$archive" -Xshare:auto)"
+    echo "$(date +'%Y-%m-%d %H:%M:%S %Z') - Created class data sharing archive $archive." \
+        "Startup ${before}ms without, ${after}ms with the archive" >> "$LOGS_DIR/installation.log"
+}
+
 create_backint() {
     # Creates the backint executable script based on the current version
     # $1 - latest version number
     local jar="$(ls $INSTALL_DESTINATION/*$version.jar)"
+    local archive="$INSTALL_DESTINATION/backint-$version.jsa"
+    local share=""
+    if [[ -s "$archive" ]]
+    then
+        share="-XX:SharedArchiveFile=$archive -Xshare:auto"
+    fi
     cat > "$INSTALL_DESTINATION/backint" <<EOF
 #!/usr/bin/env bash
 
-readonly SCRIPT="\$0"
 readonly ARGUMENTS="\$@"
 
-check_and_update() {
-    # Checks for and installs a newer version if one exists.
-    local installed="\$(cat ${INSTALL_DESTINATION}/VERSION.txt)"
-    local latest="\$(curl --show-error --silent --fail --user-agent "$USER_AGENT" \\
-        --output - "${LATEST}?alt=media")"
-    local updated=1
-    if [[ "\$latest" > "\$installed" ]]
+jvm_options() {
+    # Sizes the heap for two chunks per channel, capped at a quarter of the memory. Single
+    # channel calls, such as log backups, are short lived and use the serial GC and C1 only
+    local args=(\$ARGUMENTS)
+    local channels=1 chunk_mb heap max i
+    for (( i = 0; i < \${#args[@]} - 1; i++ ))
+    do
+        [[ "\${args[i]}" == "-c" ]] && channels="\${args[i + 1]}"
+    done
+    [[ "\$channels" =~ ^[1-9][0-9]*$ ]] || channels=1
+    chunk_mb="\$(awk '/^#CHUNK_SIZE_MB/ {print \$2}' "$PARAMETERS_FILE" 2>/dev/null)"
+    [[ "\$chunk_mb" =~ ^[1-9][0-9]*$ ]] || chunk_mb=$DEFAULT_CHUNK_SIZE_MB
+    heap=\$(( 256 + channels * chunk_mb * 2 ))
+    max=\$(awk '/^MemTotal/ {print int(\$2 / 4096)}' /proc/meminfo)
+    (( heap > max )) && heap=\$max
+    if (( channels > 1 ))
     then
-        echo "\$(date +'%Y-%m-%d %H:%M:%S %Z') - Updating \$installed to \$latest" \\
-            >> "${LOGS_DIR}/installation.log"
-        touch "$UPDATE_LOCK"
-        curl --show-error --silent --fail --user-agent "$USER_AGENT" \\
-            "${GCS_BUCKET}%2Finstall.sh?alt=media" | bash
-        updated=\$?
-        rm "$UPDATE_LOCK"
+        echo "-Xmx\${heap}m"
+    else
+        echo "-Xmx\${heap}m -XX:TieredStopAtLevel=1 -XX:+UseSerialGC"
     fi
-    return \$updated
+}
+
+check_for_update() {
+    # Starts a version check in the background if the cached one is older than the interval.
+    # Log backups never trigger it. Updates are only installed by the scheduled update job
+    [[ " \$ARGUMENTS " == *" -l LOG "* ]] && return 0
+    local interval="\$(cat "$UPDATE_INTERVAL" 2>/dev/null || echo $DEFAULT_UPDATE_INTERVAL)"
+    local checked="\$(stat -c %Y "$LATEST_CACHE" 2>/dev/null || echo 0)"
+    if (( \$(date +%s) - checked >= interval ))
+    then
+        nohup "$UPDATE_JOB" --check-only > /dev/null 2>&1 &
+    fi
+    return 0
 }
 
 wait_for_update() {
@@ -99,25 +180,14 @@ wait_for_update() {
 
 main() {
     # Main execution sequence
-    local updated=1
     if [[ -a "$UPDATE_LOCK" ]]
     then
         wait_for_update
-        updated=\$?
-    else
-        check_and_update
-        updated=\$?
-    fi
-
-    if [[ \$updated == 0 ]]
-    then
-        # Relaunch with the same parameters
-        "\$SCRIPT" "\$ARGUMENTS"
-        exit \$?
     fi
+    check_for_update
 
     # Invoke the backint JAR
-    ${INSTALL_DESTINATION}/jre/bin/java \\
+    ${INSTALL_DESTINATION}/jre/bin/java \$(jvm_options) ${share} \\
         -Djava.util.logging.config.file=${INSTALL_DESTINATION}/logging.properties \\
         -jar ${jar} \$ARGUMENTS
 }
@@ -127,8 +197,87 @@ EOF
     chmod 0755 "$INSTALL_DESTINATION/backint"
 }
 
+create_update_job() {
+    # Creates the update job, which refreshes the cached latest version at most once per interval
+    # and installs a newer version while no backint process is running
+    cat > "$UPDATE_JOB" <<EOF
+#!/usr/bin/env bash
+
+set -o pipefail
+
+# cron runs the job without the <sid>adm login environment that install.sh needs
+export SAPSYSTEMNAME="$SAPSYSTEMNAME"
+readonly MODE="\${1:-}"
+
+log() {
+    echo "\$(date +'%Y-%m-%d %H:%M:%S %Z') - \$1" >> "${LOGS_DIR}/installation.log"
+}
+
+refresh_latest() {
+    # Caches the latest version number. The file's mtime is the time of the last check
+    local interval="\$(cat "$UPDATE_INTERVAL" 2>/dev/null || echo $DEFAULT_UPDATE_INTERVAL)"
+    local checked="\$(stat -c %Y "$LATEST_CACHE" 2>/dev/null || echo 0)"
+    local latest
+    if (( \$(date +%s) - checked < interval ))
+    then
+        return 0
+    fi
+    latest="\$(curl --show-error --silent --fail --user-agent "$USER_AGENT" \\
+        --output - "${LATEST}?alt=media")" || return 1
+    echo "\$latest" > "$LATEST_CACHE.\$\$" && mv "$LATEST_CACHE.\$\$" "$LATEST_CACHE"
+}
+
+apply_update() {
+    # Installs the cached latest version if it is newer than the installed one
+    local installed="\$(cat ${INSTALL_DESTINATION}/VERSION.txt)"
+    local latest="\$(cat "$LATEST_CACHE" 2>/dev/null)"
+    local updated=0
+    if [[ -z "\$latest" ]] || [[ ! "\$latest" > "\$installed" ]]
+    then
+        return 0
+    fi
+    # A running backup keeps the installed version. The next scheduled run retries
+    if pgrep -f "${INSTALL_DESTINATION}/jre/bin/java" > /dev/null
+    then
+        log "Update to \$latest postponed, backint is running"
+        return 0
+    fi
+    log "Updating \$installed to \$latest"
+    touch "$UPDATE_LOCK"
+    curl --show-error --silent --fail --user-agent "$USER_AGENT" \\
+        "${GCS_BUCKET}%2Finstall.sh?alt=media" | bash
+    updated=\$?
+    rm -f "$UPDATE_LOCK"
+    return \$updated
+}
+
+main() {
+    # Only one check or update at a time
+    exec 9> "$INSTALL_DESTINATION/.update_job.lock"
+    flock -n 9 || return 0
+    refresh_latest || log "Unable to check for the latest version"
+    if [[ "\$MODE" != "--check-only" ]]
+    then
+        apply_update || log "Update failed with return code \$?. Retrying on the next run"
+    fi
+}
+
+main
+EOF
+    chmod 0755 "$UPDATE_JOB"
+}
+
+schedule_update_job() {
+    # Runs the update job hourly from the crontab of the installing user. The job itself
+    # only contacts GCS once per interval
+    local minute=$(( RANDOM % 60 ))
+    { crontab -l 2>/dev/null | grep -vF "$UPDATE_JOB" || true
+      echo "$minute * * * * $UPDATE_JOB"; } | crontab -
+}
+
 install() {
-    # Creates the backint logging properties file, parameters file, executable script and symlinks
+    # Creates the backint logging properties file, parameters file, executable script, update job
+    # and symlinks
     # $1 - latest version number
     local version="$1"
 
@@ -144,9 +293,16 @@ install() {
         create_parameters_file
     fi
 
-    # Create the backint executable
+    # Create the class data sharing archive and the backint executable
+    create_cds_archive "$version"
     create_backint "$version"
 
+    # Create and schedule the update job. Checks for a newer version at most once per
+    # interval, in seconds, set in UPDATE_INTERVAL.txt (default one day)
+    create_update_job
+    schedule_update_job
+    echo "$version" > "$LATEST_CACHE"
+
     # Make symlinks
     ln -sf "$INSTALL_DESTINATION/backint" "/usr/sap/$SAPSYSTEMNAME/SYS/global/hdb/opt/hdbbackint"
     if [[ ! -d "/usr/sap/$SAPSYSTEMNAME/SYS/global/hdb/opt/hdbconfig/" ]]
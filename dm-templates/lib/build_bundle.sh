@@ -0,0 +1,37 @@
+#!/bin/bash
+# ------------------------------------------------------------------------
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Description:  Google Cloud Platform - Build the SAP deployment library bundle
+# Build Date:   Sat Oct 19 12:00:00 GMT 2019
+# ------------------------------------------------------------------------
+#
+# Packs the sap_lib_*.sh libraries and their loader into lib/bundle/sap_lib-[VERSION].tar.gz
+# with a sha256 checksum, and points lib/bundle/LATEST at the version and its checksum. Run
+# before publishing the dm-templates folder to the deployment script location.
+#
+# Usage: build_bundle.sh [VERSION]
+
+set -e
+
+lib_dir=$(cd "$(dirname "${0}")" && pwd)
+version=${1:-$(date -u +%Y%m%d%H%M%S)}
+bundle=sap_lib-${version}.tar.gz
+
+mkdir -p "${lib_dir}/bundle"
+tar -czf "${lib_dir}/bundle/${bundle}" -C "${lib_dir}" $(cd "${lib_dir}" && ls sap_lib_*.sh)
+(cd "${lib_dir}/bundle" && sha256sum "${bundle}" > "${bundle}.sha256")
+echo "${version} $(cut -d' ' -f1 "${lib_dir}/bundle/${bundle}.sha256")" > "${lib_dir}/bundle/LATEST"
+
+echo "INFO - Built ${lib_dir}/bundle/${bundle}"
@@ -30,6 +30,149 @@ ha::check_settings() {
   fi
 
   mkdir -p /root/.deploy
+
+  ha::set_failover_profile
+}
+
+
+ha::set_failover_profile() {
+  local profile
+  local api_start
+  local api_latency
+  local vip_start_floor
+
+  profile=$(main::check_default balanced "${VM_METADATA[sap_failover_profile],,}")
+
+  main::errhandle_log_info "Determining cluster timings for failover profile '${profile}'"
+
+  ## base values per profile. balanced matches the timings used before profiles were introduced
+  case "${profile}" in
+    conservative)
+      HA_TOKEN=20000
+      HA_TOKEN_RETRANSMITS=10
+      HA_HANA_MONITOR=60
+      HA_TOPOLOGY_MONITOR=60
+      HA_VIP_MONITOR=60
+      HA_VIP_MONITOR_TIMEOUT=60
+      HA_STONITH_MONITOR=300
+      HA_STONITH_TIMEOUT=300
+      HA_OP_TIMEOUT=600
+      vip_start_floor=180
+      ;;
+    fast)
+      HA_TOKEN=3000
+      HA_TOKEN_RETRANSMITS=4
+      HA_HANA_MONITOR=5
+      HA_TOPOLOGY_MONITOR=10
+      HA_VIP_MONITOR=10
+      HA_VIP_MONITOR_TIMEOUT=20
+      HA_STONITH_MONITOR=120
+      HA_STONITH_TIMEOUT=60
+      HA_OP_TIMEOUT=300
+      vip_start_floor=60
+      ;;
+    *)
+      if [[ ! "${profile}" = "balanced" ]]; then
+        main::errhandle_log_warning "--- Unknown failover profile '${profile}'. Using balanced"
+        profile=balanced
+      fi
+      HA_TOKEN=5000
+      HA_TOKEN_RETRANSMITS=6
+      HA_HANA_MONITOR=10
+      HA_TOPOLOGY_MONITOR=10
+      HA_VIP_MONITOR=60
+      HA_VIP_MONITOR_TIMEOUT=60
+      HA_STONITH_MONITOR=300
+      HA_STONITH_TIMEOUT=300
+      HA_OP_TIMEOUT=600
+      vip_start_floor=180
+      ;;
+  esac
+
+  ## the primary raises the token for the network round trip to the peer in ha::set_corosync_timing
+  HA_CONSENSUS=$((HA_TOKEN * 3 / 2))
+
+  ## latency of the Compute API call the fencing and VIP agents depend on
+  api_start=$(date +%s%N)
+  ${GCLOUD} --quiet compute instances list --filter="name=('${HOSTNAME}')" --format 'csv[no-heading](zone)' >/dev/null
+  api_latency=$((($(date +%s%N) - api_start + 999999999) / 1000000000))
+  if [[ "${VM_METADATA[sap_failover_agent_latency]}" =~ ^[0-9]+$ ]] && [[ ${VM_METADATA[sap_failover_agent_latency]} -gt ${api_latency} ]]; then
+    api_latency=${VM_METADATA[sap_failover_agent_latency]}
+  fi
+
+  ## a fence is a list plus a reset which waits for its operation to complete
+  if [[ $((api_latency * 2 + 60)) -gt ${HA_STONITH_TIMEOUT} ]]; then
+    HA_STONITH_TIMEOUT=$((api_latency * 2 + 60))
+  fi
+
+  ## the alias agent makes up to ten API calls when moving the VIP
+  HA_VIP_START_TIMEOUT=${vip_start_floor}
+  if [[ $((api_latency * 10)) -gt ${HA_VIP_START_TIMEOUT} ]]; then
+    HA_VIP_START_TIMEOUT=$((api_latency * 10))
+  fi
+
+  main::errhandle_log_info "--- Compute API latency ${api_latency}s"
+  main::errhandle_log_info "--- Corosync token ${HA_TOKEN}ms, consensus ${HA_CONSENSUS}ms, retransmits ${HA_TOKEN_RETRANSMITS}"
+  main::errhandle_log_info "--- SAP HANA monitor ${HA_HANA_MONITOR}s, VIP monitor ${HA_VIP_MONITOR}s, VIP start timeout ${HA_VIP_START_TIMEOUT}s"
+  main::errhandle_log_info "--- STONITH timeout ${HA_STONITH_TIMEOUT}s, STONITH monitor ${HA_STONITH_MONITOR}s, operation timeout ${HA_OP_TIMEOUT}s"
+}
+
+
+ha::set_corosync_timing() {
+  local rtt_ms
+  local count=0
+
+  ## network round trip to the peer - token must stay well clear of it across zones and regions.
+  ## corosync requires the same token and consensus on both nodes, so only the primary measures it, once the
+  ## secondary is up, and ha::get_corosync_timing picks up its values on the secondary
+  rtt_ms=$(ping -c 5 -q "${VM_METADATA[sap_secondary_instance]}" | awk -F'/' '/^rtt/ { print int($5 + 1) }')
+  while [[ -z "${rtt_ms}" ]] && [[ ${count} -lt 30 ]]; do
+    sleep 10
+    rtt_ms=$(ping -c 5 -q "${VM_METADATA[sap_secondary_instance]}" | awk -F'/' '/^rtt/ { print int($5 + 1) }')
+    count=$((count +1))
+  done
+
+  if [[ -n "${rtt_ms}" ]]; then
+    main::errhandle_log_info "--- Peer round trip ${rtt_ms}ms"
+    if [[ $((rtt_ms * 200)) -gt ${HA_TOKEN} ]]; then
+      HA_TOKEN=$((rtt_ms * 200))
+      HA_CONSENSUS=$((HA_TOKEN * 3 / 2))
+    fi
+  else
+    main::errhandle_log_warning "--- Unable to ping ${VM_METADATA[sap_secondary_instance]}. Keeping the profile's corosync token ${HA_TOKEN}ms, which may be too short for the network round trip"
+  fi
+  main::errhandle_log_info "--- Corosync token ${HA_TOKEN}ms, consensus ${HA_CONSENSUS}ms"
+
+  ha::put_corosync_timing
+}
+
+
+ha::put_corosync_timing() {
+  local count=0
+
+  ## hand the primary's token and consensus to the secondary through its metadata
+  while ! ${GCLOUD} --quiet compute instances add-metadata "${VM_METADATA[sap_secondary_instance]}" --zone "${VM_METADATA[sap_secondary_zone]}" --metadata "sap_ha_corosync_timing=${HA_TOKEN} ${HA_CONSENSUS}" >/dev/null 2>&1; do
+    ## concurrent metadata updates of the same instance fail. Back off and try again
+    count=$((count +1))
+    if [[ ${count} -gt 10 ]]; then
+      main::errhandle_log_warning "--- Unable to pass the corosync timings to ${VM_METADATA[sap_secondary_instance]}"
+      return 1
+    fi
+    sleep $((RANDOM % 5 + 1))
+  done
+}
+
+
+ha::get_corosync_timing() {
+  local timing
+
+  timing=$(main::get_metadata sap_ha_corosync_timing)
+  if [[ ! "${timing}" =~ ^[0-9]+\ [0-9]+$ ]]; then
+    main::errhandle_log_warning "--- No corosync timings from ${VM_METADATA[sap_primary_instance]}. Using token ${HA_TOKEN}ms, consensus ${HA_CONSENSUS}ms which may not match the primary"
+    return 1
+  fi
+  read -r HA_TOKEN HA_CONSENSUS <<< "${timing}"
+  main::errhandle_log_info "--- Using corosync token ${HA_TOKEN}ms, consensus ${HA_CONSENSUS}ms from ${VM_METADATA[sap_primary_instance]}"
 }
 
 
@@ -39,9 +182,11 @@ ha::download_scripts() {
   mkdir -p /usr/lib64/stonith/plugins/external
   curl https://storage.googleapis.com/sapdeploy/pacemaker-gcp/alias -o /usr/lib/ocf/resource.d/gcp/alias
   curl https://storage.googleapis.com/sapdeploy/pacemaker-gcp/route -o /usr/lib/ocf/resource.d/gcp/route
+  curl https://storage.googleapis.com/sapdeploy/pacemaker-gcp/ilb -o /usr/lib/ocf/resource.d/gcp/ilb
   curl https://storage.googleapis.com/sapdeploy/pacemaker-gcp/gcpstonith -o /usr/lib64/stonith/plugins/external/gcpstonith
   chmod +x /usr/lib/ocf/resource.d/gcp/alias
   chmod +x /usr/lib/ocf/resource.d/gcp/route
+  chmod +x /usr/lib/ocf/resource.d/gcp/ilb
   chmod +x /usr/lib64/stonith/plugins/external/gcpstonith
 }
 
@@ -107,41 +252,39 @@ ha::install_primary_sshkeys() {
 
 
 ha::wait_for_secondary() {
-  local count=0
-
   main::errhandle_log_info "Waiting for ready signal from ${VM_METADATA[sap_secondary_instance]} before continuing"
 
-  while [[ ! -f /root/.deploy/.${VM_METADATA[sap_secondary_instance]}.ready ]]; do
-		count=$((count +1))
+  ## released as soon as the secondary signals through the metadata of this instance. The ready file is the fallback
+  if ! main::barrier_wait ha_ready 960 "${VM_METADATA[sap_secondary_instance]}"; then
     scp -o StrictHostKeyChecking=no "${VM_METADATA[sap_secondary_instance]}":/root/.deploy/."${VM_METADATA[sap_secondary_instance]}".ready /root/.deploy
-    main::errhandle_log_info "--- ${VM_METADATA[sap_secondary_instance]} is not ready - sleeping for 60 seconds then trying again"
-    sleep 60s
-    if [ ${count} -gt 15 ]; then
+    if [[ ! -f /root/.deploy/."${VM_METADATA[sap_secondary_instance]}".ready ]]; then
       main::errhandle_log_warning "${VM_METADATA[sap_secondary_instance]} wasn't ready in time. Both SAP HANA systems have been installed and configured but the remainder of the HA setup will need to be manually performed"
       main::complete
     fi
-  done
+  fi
 
   main::errhandle_log_info "--- ${VM_METADATA[sap_secondary_instance]} is now ready - continuing HA setup"
 }
 
 
 ha::wait_for_primary() {
-  local count=0
+  local timeout=660
 
   main::errhandle_log_info "Waiting for ready signal from ${VM_METADATA[sap_primary_instance]} before continuing"
-  scp -o StrictHostKeyChecking=no "${VM_METADATA[sap_primary_instance]}":/root/.deploy/."${VM_METADATA[sap_primary_instance]}".ready /root/.deploy
 
-  while [[ ! -f /root/.deploy/."${VM_METADATA[sap_primary_instance]}".ready ]]; do
-		count=$((count +1))
+  ## released as soon as the primary signals through the metadata of this instance. The ready file is the fallback.
+  ## With a seed, the primary only signals once its disk snapshot has been uploaded, which can take up to an hour more
+  if [[ "${VM_METADATA[sap_hana_hsr_seed],,}" =~ ^(yes|true)$ ]]; then
+    timeout=$((timeout + 3600))
+  fi
+
+  if ! main::barrier_wait ha_ready "${timeout}" "${VM_METADATA[sap_primary_instance]}"; then
     scp -o StrictHostKeyChecking=no "${VM_METADATA[sap_primary_instance]}":/root/.deploy/."${VM_METADATA[sap_primary_instance]}".ready /root/.deploy
-    main::errhandle_log_info "--- ${VM_METADATA[sap_primary_instance]} is not not ready - sleeping for 60 seconds then trying again"
-    sleep 60s
-    if [ ${count} -gt 10 ]; then
+    if [[ ! -f /root/.deploy/."${VM_METADATA[sap_primary_instance]}".ready ]]; then
       main::errhandle_log_warning "${VM_METADATA[sap_primary_instance]} wasn't ready in time. Both SAP HANA systems have been installed and configured but the remainder of the HA setup will need to be manually performed"
       main::complete
     fi
-  done
+  fi
 
   main::errhandle_log_info "--- ${VM_METADATA[sap_primary_instance]} is now ready - continuing HA setup"
 }
@@ -149,6 +292,17 @@ ha::wait_for_primary() {
 
 ha::ready(){
   echo "ready" > /root/.deploy/."${HOSTNAME}".ready
+
+  ## wake up the peer waiting in ha::wait_for_primary or ha::wait_for_secondary
+  if [[ "${HOSTNAME}" = "${VM_METADATA[sap_primary_instance]}" ]]; then
+    if ! main::barrier_arrive -z "${VM_METADATA[sap_secondary_zone]}" ha_ready "${VM_METADATA[sap_secondary_instance]}"; then
+      main::errhandle_log_warning "--- ${VM_METADATA[sap_secondary_instance]} will pick up the ready file after its wait times out"
+    fi
+  else
+    if ! main::barrier_arrive -z "${VM_METADATA[sap_primary_zone]}" ha_ready "${VM_METADATA[sap_primary_instance]}"; then
+      main::errhandle_log_warning "--- ${VM_METADATA[sap_primary_instance]} will pick up the ready file after its wait times out"
+    fi
+  fi
 }
 
 
@@ -176,12 +330,150 @@ ha::enable_hsr() {
 }
 
 
+ha::config_hsr_network() {
+  local replication_ip
+  local peer
+  local peer_zone
+  local peer_replication_ip
+
+  if [[ -z "${VM_METADATA[sap_hana_replication_subnetwork]}" ]]; then
+    return 0
+  fi
+
+  main::errhandle_log_info "Configuring SAP HANA System Replication to use subnetwork ${VM_METADATA[sap_hana_replication_subnetwork]}"
+
+  if [[ "${HOSTNAME}" = "${VM_METADATA[sap_primary_instance]}" ]]; then
+    peer=${VM_METADATA[sap_secondary_instance]}
+    peer_zone=${VM_METADATA[sap_secondary_zone]}
+  else
+    peer=${VM_METADATA[sap_primary_instance]}
+    peer_zone=${VM_METADATA[sap_primary_zone]}
+  fi
+
+  replication_ip=$(main::get_metadata http://169.254.169.254/computeMetadata/v1/instance/network-interfaces/1/ip)
+  peer_replication_ip=$(${GCLOUD} --quiet compute instances describe "${peer}" --zone "${peer_zone}" --format="value(networkInterfaces[1].networkIP)")
+
+  if [[ -z "${replication_ip}" ]] || [[ -z "${peer_replication_ip}" ]]; then
+    main::errhandle_log_warning "--- Unable to determine replication network addresses. SAP HANA System Replication will use the primary network"
+    return 0
+  fi
+
+  main::errhandle_log_info "--- ${HOSTNAME} replicates via ${replication_ip}, ${peer} via ${peer_replication_ip}"
+  hdb::queue_parameters global.ini system_replication_hostname_resolution "${replication_ip}" "${HOSTNAME}"
+  hdb::queue_parameters global.ini system_replication_hostname_resolution "${peer_replication_ip}" "${peer}"
+  hdb::apply_parameters
+}
+
+
 ha::config_hsr() {
   main::errhandle_log_info "Configuring SAP HANA system replication primary -> secondary"
+  if [[ -n "${VM_METADATA[sap_hana_replication_subnetwork]}" ]]; then
+    main::errhandle_log_info "--- Replication traffic will use subnetwork ${VM_METADATA[sap_hana_replication_subnetwork]}"
+  fi
   runuser -l "${VM_METADATA[sap_hana_sid],,}adm" -c "hdbnsutil -sr_register --remoteHost=${VM_METADATA[sap_primary_instance]} --remoteInstance=${VM_METADATA[sap_hana_instance_number]} --replicationMode=syncmem --operationMode=logreplay --name=${VM_METADATA[sap_secondary_instance]}"
 }
 
 
+ha::create_hsr_seed() {
+  local seed_start=${SECONDS}
+  local freeze_start
+  local status
+  local count=0
+
+  if [[ ! "${VM_METADATA[sap_hana_hsr_seed],,}" =~ ^(yes|true)$ ]]; then
+    return 0
+  fi
+
+  main::errhandle_log_info "Creating snapshot ${HOSTNAME}-hsr-seed to seed SAP HANA System Replication"
+
+  ## the primary keeps the database snapshot until ha::close_hsr_seed. A secondary seeded from it only receives the changes made since
+  if ! bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} \"BACKUP DATA FOR FULL SYSTEM CREATE SNAPSHOT COMMENT 'hsr_seed'\""; then
+    main::errhandle_log_warning "--- Unable to prepare a SAP HANA database snapshot. The secondary will receive a full initial data shipment"
+    return 0
+  fi
+
+  ## freeze /hana/data, so the disk snapshot is consistent with the database snapshot
+  sync
+  freeze_start=${SECONDS}
+  fsfreeze -f /hana/data
+  if ! ${GCLOUD} --quiet compute disks snapshot "${HOSTNAME}"-pdssd --zone "${VM_METADATA[sap_primary_zone]}" --snapshot-names "${HOSTNAME}"-hsr-seed --async >/dev/null; then
+    fsfreeze -u /hana/data
+    main::errhandle_log_warning "--- Unable to snapshot ${HOSTNAME}-pdssd. The secondary will receive a full initial data shipment"
+    ha::close_hsr_seed
+    return 0
+  fi
+
+  ## HANA can't write to /hana/data while it is frozen. Thaw as soon as the snapshot has captured the disk, the upload continues in the background
+  status=CREATING
+  while [[ "${status}" =~ ^(CREATING|)$ ]] && [[ ${count} -lt 300 ]]; do
+    sleep 1
+    status=$(${GCLOUD} --quiet compute snapshots describe "${HOSTNAME}"-hsr-seed --format='value(status)' 2>/dev/null)
+    count=$((count +1))
+  done
+  fsfreeze -u /hana/data
+  main::errhandle_log_info "--- /hana/data was frozen for $((SECONDS - freeze_start)) seconds"
+
+  ## ha::wait_for_primary on the secondary allows an hour for the seed
+  while [[ "${status}" = "UPLOADING" ]] && [[ $((SECONDS - seed_start)) -lt 3300 ]]; do
+    sleep 10
+    status=$(${GCLOUD} --quiet compute snapshots describe "${HOSTNAME}"-hsr-seed --format='value(status)' 2>/dev/null)
+  done
+  if [[ ! "${status}" = "READY" ]]; then
+    main::errhandle_log_warning "--- Snapshot ${HOSTNAME}-hsr-seed ended in status '${status}'. The secondary will receive a full initial data shipment"
+    ha::close_hsr_seed
+    return 0
+  fi
+
+  main::errhandle_log_info "--- Snapshot ${HOSTNAME}-hsr-seed created in $((SECONDS - seed_start)) seconds"
+}
+
+
+ha::restore_hsr_seed() {
+  local seed_start=${SECONDS}
+  local seed_snapshot=${VM_METADATA[sap_primary_instance]}-hsr-seed
+
+  if [[ ! "${VM_METADATA[sap_hana_hsr_seed],,}" =~ ^(yes|true)$ ]]; then
+    return 0
+  fi
+
+  if ! ${GCLOUD} --quiet compute snapshots describe "${seed_snapshot}" >/dev/null 2>&1; then
+    main::errhandle_log_warning "Snapshot ${seed_snapshot} not found. The secondary will receive a full initial data shipment"
+    return 0
+  fi
+
+  main::errhandle_log_info "Seeding /hana/data from snapshot ${seed_snapshot}"
+  if ! hdb::mount_snapshot "${seed_snapshot}" /mnt/hsr_seed; then
+    main::errhandle_log_warning "--- Unable to mount a disk created from ${seed_snapshot}. The secondary will receive a full initial data shipment"
+    return 0
+  fi
+
+  main::errhandle_log_info "--- Copying the data volumes of ${VM_METADATA[sap_primary_instance]}"
+  rm -rf /hana/data/"${VM_METADATA[sap_hana_sid]}"/*
+  if cp -a /mnt/hsr_seed/"${VM_METADATA[sap_hana_sid]}"/. /hana/data/"${VM_METADATA[sap_hana_sid]}"/; then
+    main::errhandle_log_info "--- /hana/data seeded in $((SECONDS - seed_start)) seconds. Only changes since the snapshot will be replicated"
+  else
+    main::errhandle_log_warning "--- Unable to copy the data volumes. The secondary will receive a full initial data shipment"
+  fi
+  hdb::unmount_snapshot /mnt/hsr_seed
+}
+
+
+ha::close_hsr_seed() {
+  local backup_id
+
+  if [[ ! "${VM_METADATA[sap_hana_hsr_seed],,}" =~ ^(yes|true)$ ]]; then
+    return 0
+  fi
+
+  main::errhandle_log_info "Removing the SAP HANA System Replication seed snapshot"
+  backup_id=$(bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} -a -x \"SELECT BACKUP_ID FROM M_BACKUP_CATALOG WHERE ENTRY_TYPE_NAME = 'data snapshot' AND STATE_NAME = 'prepared' AND COMMENT = 'hsr_seed'\"" | head -1)
+  if [[ -n "${backup_id}" ]]; then
+    bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} \"BACKUP DATA FOR FULL SYSTEM CLOSE SNAPSHOT BACKUP_ID ${backup_id} UNSUCCESSFUL 'hsr_seed'\""
+  fi
+  ${GCLOUD} --quiet compute snapshots delete "${HOSTNAME}"-hsr-seed >/dev/null 2>&1
+}
+
+
 ha::check_hdb_replication(){
   main::errhandle_log_info "Checking SAP HANA replication status"
   # check status
@@ -227,10 +519,10 @@ ha::config_corosync(){
       crypto_cipher: aes256
       cluster_name:	hacluster
       clear_node_high_bit: yes
-      token: 5000
-      token_retransmits_before_loss_const: 6
+      token: ${HA_TOKEN}
+      token_retransmits_before_loss_const: ${HA_TOKEN_RETRANSMITS}
       join: 60
-      consensus: 7500
+      consensus: ${HA_CONSENSUS}
       max_messages:	20
       transport: udpu
       interface {
@@ -286,7 +578,7 @@ ha::config_pacemaker_primary() {
     systemctl start pacemaker
   elif [ "${LINUX_DISTRO}" = "RHEL" ]; then
     main::errhandle_log_info "--- Creating /etc/corosync/corosync.conf"
-    pcs cluster setup --name hana --local "${VM_METADATA[sap_primary_instance]} ${VM_METADATA[sap_secondary_instance]}" --force
+    pcs cluster setup --name hana --local "${VM_METADATA[sap_primary_instance]} ${VM_METADATA[sap_secondary_instance]}" --token "${HA_TOKEN}" --consensus "${HA_CONSENSUS}" --force
     main::errhandle_log_info "--- Starting cluster services & enabling on startup"
     service pacemaker start
     service pscd start
@@ -308,6 +600,7 @@ ha::pacemaker_maintenance() {
 
 ha::config_pacemaker_secondary() {
   main::errhandle_log_info "Joining ${VM_METADATA[sap_secondary_instance]} to cluster"
+  ha::get_corosync_timing
 
   if [ "${LINUX_DISTRO}" = "SLES" ]; then
     ha::config_corosync "${SECONDARY_NODE_IP}"
@@ -318,7 +611,7 @@ ha::config_pacemaker_secondary() {
     systemctl start hawk    
   elif [ "${LINUX_DISTRO}" = "RHEL" ]; then
     corosync-keygen
-    pcs cluster setup --name hana --local "${VM_METADATA[sap_primary_instance]} ${VM_METADATA[sap_secondary_instance]}" --force
+    pcs cluster setup --name hana --local "${VM_METADATA[sap_primary_instance]} ${VM_METADATA[sap_secondary_instance]}" --token "${HA_TOKEN}" --consensus "${HA_CONSENSUS}" --force
     service pacemaker start
     service pscd start
     systemctl enable pcsd.service
@@ -332,8 +625,8 @@ ha::config_pacemaker_secondary() {
 ha::pacemaker_add_stonith() {
   main::errhandle_log_info "Cluster: Adding STONITH devices"
   if [ "${LINUX_DISTRO}" = "SLES" ]; then
-    crm configure primitive STONITH-"${VM_METADATA[sap_primary_instance]}" stonith:external/gcpstonith op monitor interval="300s" timeout="60s" on-fail="restart" op start interval="0" timeout="60s" onfail="restart" params instance_name="${VM_METADATA[sap_primary_instance]}" gcloud_path="${GCLOUD}" logging="yes"
-    crm configure primitive STONITH-"${VM_METADATA[sap_secondary_instance]}" stonith:external/gcpstonith op monitor interval="300s" timeout="60s" on-fail="restart" op start interval="0" timeout="60s" onfail="restart" params instance_name="${VM_METADATA[sap_secondary_instance]}" gcloud_path="${GCLOUD}" logging="yes"
+    crm configure primitive STONITH-"${VM_METADATA[sap_primary_instance]}" stonith:external/gcpstonith op monitor interval="${HA_STONITH_MONITOR}s" timeout="60s" on-fail="restart" op start interval="0" timeout="60s" onfail="restart" params instance_name="${VM_METADATA[sap_primary_instance]}" gcloud_path="${GCLOUD}" logging="yes"
+    crm configure primitive STONITH-"${VM_METADATA[sap_secondary_instance]}" stonith:external/gcpstonith op monitor interval="${HA_STONITH_MONITOR}s" timeout="60s" on-fail="restart" op start interval="0" timeout="60s" onfail="restart" params instance_name="${VM_METADATA[sap_secondary_instance]}" gcloud_path="${GCLOUD}" logging="yes"
     crm configure location LOC_STONITH_"${VM_METADATA[sap_primary_instance]}" STONITH-"${VM_METADATA[sap_primary_instance]}" -inf: "${VM_METADATA[sap_primary_instance]}"
     crm configure location LOC_STONITH_"${VM_METADATA[sap_secondary_instance]}" STONITH-"${VM_METADATA[sap_secondary_instance]}" -inf: "${VM_METADATA[sap_secondary_instance]}"
   fi
@@ -342,13 +635,20 @@ ha::pacemaker_add_stonith() {
 
 ha::pacemaker_add_vip() {
   main::errhandle_log_info "Cluster: Adding virtual IP"
+
+  ## internal load balancer - the forwarding rule owns the VIP, the cluster only answers the health check
+  if [[ "${VM_METADATA[sap_vip_solution]}" = "ILB" ]]; then
+    ha::pacemaker_add_ilb
+    return 0
+  fi
+
   if ! ping -c 1 -W 1 "${VM_METADATA[sap_vip]}"; then 
     if [ "${LINUX_DISTRO}" = "SLES" ]; then
       crm configure primitive rsc_vip_int-primary IPaddr2 params ip="${VM_METADATA[sap_vip]}" cidr_netmask=32 nic="eth0" op monitor interval=10s
       if [[ -n "${VM_METADATA[sap_vip_secondary_range]}" ]]; then
-        crm configure primitive rsc_vip_gcp-primary ocf:gcp:alias op monitor interval="60s" timeout="60s" op start interval="0" timeout="180s" op stop interval="0" timeout="180s" params alias_ip="${VM_METADATA[sap_vip]}/32" hostlist="${VM_METADATA[sap_primary_instance]} ${VM_METADATA[sap_secondary_instance]}" gcloud_path="${GCLOUD}" alias_range_name="${VM_METADATA[sap_vip_secondary_range}" logging="yes" meta priority=10
+        crm configure primitive rsc_vip_gcp-primary ocf:gcp:alias op monitor interval="${HA_VIP_MONITOR}s" timeout="${HA_VIP_MONITOR_TIMEOUT}s" op start interval="0" timeout="${HA_VIP_START_TIMEOUT}s" op stop interval="0" timeout="${HA_VIP_START_TIMEOUT}s" params alias_ip="${VM_METADATA[sap_vip]}/32" hostlist="${VM_METADATA[sap_primary_instance]} ${VM_METADATA[sap_secondary_instance]}" gcloud_path="${GCLOUD}" alias_range_name="${VM_METADATA[sap_vip_secondary_range}" logging="yes" meta priority=10
       else
-        crm configure primitive rsc_vip_gcp-primary ocf:gcp:alias op monitor interval="60s" timeout="60s" op start interval="0" timeout="180s" op stop interval="0" timeout="180s" params alias_ip="${VM_METADATA[sap_vip]}/32" hostlist="${VM_METADATA[sap_primary_instance]} ${VM_METADATA[sap_secondary_instance]}" gcloud_path="${GCLOUD}" logging="yes" meta priority=10
+        crm configure primitive rsc_vip_gcp-primary ocf:gcp:alias op monitor interval="${HA_VIP_MONITOR}s" timeout="${HA_VIP_MONITOR_TIMEOUT}s" op start interval="0" timeout="${HA_VIP_START_TIMEOUT}s" op stop interval="0" timeout="${HA_VIP_START_TIMEOUT}s" params alias_ip="${VM_METADATA[sap_vip]}/32" hostlist="${VM_METADATA[sap_primary_instance]} ${VM_METADATA[sap_secondary_instance]}" gcloud_path="${GCLOUD}" logging="yes" meta priority=10
       fi
       crm configure group g-primary rsc_vip_int-primary rsc_vip_gcp-primary
     fi
@@ -358,24 +658,41 @@ ha::pacemaker_add_vip() {
 }
 
 
+ha::pacemaker_add_ilb() {
+  local healthcheck_port
+
+  healthcheck_port=$(main::check_default 60000 "${VM_METADATA[sap_vip_healthcheck_port]}")
+
+  main::errhandle_log_info "--- Using internal load balancer ${VM_METADATA[sap_vip]} with health check port ${healthcheck_port}"
+  if [ "${LINUX_DISTRO}" = "SLES" ]; then
+    crm configure primitive rsc_vip_int-primary IPaddr2 params ip="${VM_METADATA[sap_vip]}" cidr_netmask=32 nic="eth0" op monitor interval=10s
+    crm configure primitive rsc_vip_hc-primary ocf:gcp:ilb op monitor interval="10s" timeout="10s" op start interval="0" timeout="20s" op stop interval="0" timeout="20s" params port="${healthcheck_port}" gcloud_path="${GCLOUD}" logging="yes" meta priority=10
+    crm configure group g-primary rsc_vip_int-primary rsc_vip_hc-primary
+  elif [ "${LINUX_DISTRO}" = "RHEL" ]; then
+    pcs resource create rsc_vip_int-primary IPaddr2 ip="${VM_METADATA[sap_vip]}" cidr_netmask=32 nic="eth0" op monitor interval=10s --group g-primary
+    pcs resource create rsc_vip_hc-primary ocf:gcp:ilb port="${healthcheck_port}" gcloud_path="${GCLOUD}" logging="yes" op monitor interval=10s timeout=10s op start interval=0 timeout=20s op stop interval=0 timeout=20s meta priority=10 --group g-primary
+  fi
+}
+
+
 ha::pacemaker_config_bootstrap_hdb() {
   main::errhandle_log_info "Cluster: Configuring bootstrap for SAP HANA"
   if [ "${LINUX_DISTRO}" = "SLES" ]; then
     crm configure property no-quorum-policy="ignore"
     crm configure property startup-fencing="true"
-    crm configure property stonith-timeout="300s"
+    crm configure property stonith-timeout="${HA_STONITH_TIMEOUT}s"
     crm configure property stonith-enabled="true"
     crm configure rsc_defaults resource-stickiness="1000"
     crm configure rsc_defaults migration-threshold="5000"
-    crm configure op_defaults timeout="600"
+    crm configure op_defaults timeout="${HA_OP_TIMEOUT}"
   elif [ "${LINUX_DISTRO}" = "RHEL" ]; then
     pcs property set no-quorum-policy="ignore"
     pcs property set startup-fencing="true"
-    pcs property set stonith-timeout="300s"
+    pcs property set stonith-timeout="${HA_STONITH_TIMEOUT}s"
     pcs property set stonith-enabled="true"
     pcs resource defaults default-resource-stickness=1000
     pcs resource defaults default-migration-threshold=5000
-    pcs resource op defaults timeout=600s
+    pcs resource op defaults timeout="${HA_OP_TIMEOUT}s"
   fi
 }
 
@@ -385,19 +702,19 @@ ha::pacemaker_config_bootstrap_nfs() {
   if [ "${LINUX_DISTRO}" = "SLES" ]; then
     crm configure property no-quorum-policy="ignore"
     crm configure property startup-fencing="true"
-    crm configure property stonith-timeout="300s"
+    crm configure property stonith-timeout="${HA_STONITH_TIMEOUT}s"
     crm configure property stonith-enabled="true"
     crm configure rsc_defaults resource-stickiness="100"
     crm configure rsc_defaults migration-threshold="5000"
-    crm configure op_defaults timeout="600"
+    crm configure op_defaults timeout="${HA_OP_TIMEOUT}"
   elif [ "${LINUX_DISTRO}" = "RHEL" ]; then
     pcs property set no-quorum-policy="ignore"
     pcs property set startup-fencing="true"
-    pcs property set stonith-timeout="300s"
+    pcs property set stonith-timeout="${HA_STONITH_TIMEOUT}s"
     pcs property set stonith-enabled="true"
     pcs resource defaults default-resource-stickness=1000
     pcs resource defaults default-migration-threshold=5000
-    pcs resource op defaults timeout=600s
+    pcs resource op defaults timeout="${HA_OP_TIMEOUT}s"
   fi
 }
 
@@ -409,7 +726,7 @@ ha::pacemaker_add_hana() {
     cat <<EOF > /root/.deploy/cluster.tmp
     primitive rsc_SAPHanaTopology_${VM_METADATA[sap_hana_sid]}_HDB${VM_METADATA[sap_hana_instance_number]} ocf:suse:SAPHanaTopology \
         operations \$id="rsc_sap2_${VM_METADATA[sap_hana_sid]}_HDB${VM_METADATA[sap_hana_instance_number]}-operations" \
-        op monitor interval="10" timeout="600" \
+        op monitor interval="${HA_TOPOLOGY_MONITOR}" timeout="600" \
         op start interval="0" timeout="600" \
         op stop interval="0" timeout="300" \
         params SID="${VM_METADATA[sap_hana_sid]}" InstanceNumber="${VM_METADATA[sap_hana_instance_number]}"
@@ -426,8 +743,8 @@ EOF
         op start interval="0" timeout="3600" \
         op stop interval="0" timeout="3600" \
         op promote interval="0" timeout="3600" \
-        op monitor interval="10" role="Master" timeout="700" \
-        op monitor interval="11" role="Slave" timeout="700" \
+        op monitor interval="${HA_HANA_MONITOR}" role="Master" timeout="700" \
+        op monitor interval="$((HA_HANA_MONITOR + 1))" role="Slave" timeout="700" \
         params SID="${VM_METADATA[sap_hana_sid]}" InstanceNumber="${VM_METADATA[sap_hana_instance_number]}" PREFER_SITE_TAKEOVER="true" \
         DUPLICATE_PRIMARY_TIMEOUT="7200" AUTOMATED_REGISTER="true"
 
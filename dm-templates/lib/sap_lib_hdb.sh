@@ -108,6 +108,11 @@ hdb::create_backup_volume() {
 
 hdb::set_kernel_parameters(){
   main::errhandle_log_info "Setting kernel paramaters"
+
+  if main::image_prepared kernel_parameters; then
+    main::errhandle_log_info "--- Kernel parameters and tuned/saptune already configured in image $(main::image_version)"
+    return 0
+  fi
   {
     echo "vm.pagecache_limit_mb = 0"
     echo "net.ipv4.tcp_slow_start_after_idle=0"
@@ -138,22 +143,102 @@ hdb::set_kernel_parameters(){
 }
 
 
-hdb::download_media() {
-	main::errhandle_log_info "Downloading HANA media from ${VM_METADATA[sap_hana_deployment_bucket]}"
-	mkdir -p /hana/shared/media
+hdb::get_media_number() {
+  mkdir -p /root/.deploy
+
+  ## list the bucket once. The listing is reused by hdb::download_media to size the download
+  rm -f /root/.deploy/hana_media.status
+  ${GSUTIL} ls -l gs://"${VM_METADATA[sap_hana_deployment_bucket]}" > /root/.deploy/hana_media.list
 
   # Set the media number, so we know
-  VM_METADATA[sap_hana_media_number]="$(${GSUTIL} ls gs://${VM_METADATA[sap_hana_deployment_bucket]} | grep _part1.exe | awk -F"/" '{print $NF}' | sed 's/_part1.exe//')"
+  VM_METADATA[sap_hana_media_number]="$(grep _part1.exe /root/.deploy/hana_media.list | awk -F"/" '{print $NF}' | sed 's/_part1.exe//')"
+
+  ## look for an already extracted copy of this media. Download and extraction are skipped when one is found
+  VM_METADATA[sap_hana_media_cache_key]=$(hdb::media_cache_key hana_media "gs://${VM_METADATA[sap_hana_deployment_bucket]}/${VM_METADATA[sap_hana_media_number]}_part*" "${VM_METADATA[sap_hana_extract_components]}")
+  if hdb::media_cache_exists "${VM_METADATA[sap_hana_media_cache_key]}"; then
+    main::errhandle_log_info "--- Extracted SAP HANA media ${VM_METADATA[sap_hana_media_cache_key]} found in ${VM_METADATA[sap_hana_media_cache]}"
+    VM_METADATA[sap_hana_media_cached]=yes
+  fi
 
   ## download unrar from GCS. Fix for RHEL missing unrar and SAP packaging change which stoppped unar working.
-  curl "${DEPLOY_URL}"/third_party/unrar/unrar -o /root/.deploy/unrar
-  chmod a=wrx /root/.deploy/unrar
+  if [[ ! -x /root/.deploy/unrar ]]; then
+    curl -s "${DEPLOY_URL}"/third_party/unrar/unrar -o /root/.deploy/unrar.tmp
+    chmod a=wrx /root/.deploy/unrar.tmp
+    mv /root/.deploy/unrar.tmp /root/.deploy/unrar
+  fi
+}
+
+
+hdb::download_media() {
+  local processes
+  local media_bytes
+  local bytes_before
+  local bytes_downloaded
+  local download_start
+  local duration
+  local sliced_threshold=150M
+  local exclude=".part*$|IMDB_SERVER*.SAR$"
+  local status=done
+
+	main::errhandle_log_info "Downloading HANA media from ${VM_METADATA[sap_hana_deployment_bucket]}"
+	mkdir -p /hana/shared/media /root/.deploy
 
-  ## download SAP HANA media
-  if ! ${GSUTIL} rsync -x ".part*$|IMDB_SERVER*.SAR$" gs://"${VM_METADATA[sap_hana_deployment_bucket]}" /hana/shared/media/ ; then
+  ## already set when the media number is looked up in a separate step
+  if [[ -z "${VM_METADATA[sap_hana_media_number]}" ]] || [[ ! -f /root/.deploy/hana_media.list ]]; then
+    hdb::get_media_number
+  fi
+
+  ## hdb::extract_media follows the download through this file
+  rm -f /root/.deploy/hana_media.status
+
+  ## with the extracted media restored, only the other objects in the bucket are downloaded
+  if [[ "${VM_METADATA[sap_hana_media_cached]}" = "yes" ]]; then
+    if hdb::media_cache_fetch "${VM_METADATA[sap_hana_media_cache_key]}" /hana/shared/media; then
+      status=cached
+      echo "${status}" > /root/.deploy/hana_media.status
+      exclude+="|^${VM_METADATA[sap_hana_media_number]}_part[0-9]+\.(exe|rar)$"
+    else
+      main::errhandle_log_warning "--- Unable to restore the extracted SAP HANA media. Downloading the media instead"
+    fi
+  fi
+
+  ## sliced downloads need the compiled crcmod module to verify CRC32C checksums at speed
+  if ! ${GSUTIL} version -l | grep -q "compiled crcmod: True"; then
+    pip install -q --no-cache-dir -U crcmod >/dev/null 2>&1
+    if ! ${GSUTIL} version -l | grep -q "compiled crcmod: True"; then
+      main::errhandle_log_info "--- Compiled crcmod is not available. Large objects will be downloaded without slicing"
+      sliced_threshold=0
+    fi
+  fi
+
+  ## network bandwidth scales with vCPUs (2 Gbps each, up to 32 Gbps), so scale parallelism the same way
+  processes=$(( VM_CPUCOUNT < 16 ? VM_CPUCOUNT : 16 ))
+  media_bytes=$(awk -v status="${status}" -v parts="/${VM_METADATA[sap_hana_media_number]}_part[0-9]+\\.(exe|rar)$" '/gs:\/\// && $1 ~ /^[0-9]+$/ && !(status == "cached" && $NF ~ parts) { total += $1 } END { print total + 0 }' /root/.deploy/hana_media.list)
+  bytes_before=$(du -sb /hana/shared/media | awk '{ print $1 }')
+  main::errhandle_log_info "--- Downloading $((media_bytes / 1024 / 1024)) MB with ${processes} processes of 4 threads, expected bandwidth $(( 2 * VM_CPUCOUNT < 32 ? 2 * VM_CPUCOUNT : 32 )) Gbps"
+
+  ## download SAP HANA media. check_hashes=always verifies the CRC32C of every object and slice
+  download_start=$(date +%s.%N)
+  if ! ${GSUTIL} -m -q \
+      -o "GSUtil:parallel_process_count=${processes}" \
+      -o "GSUtil:parallel_thread_count=4" \
+      -o "GSUtil:sliced_object_download_threshold=${sliced_threshold}" \
+      -o "GSUtil:sliced_object_download_max_components=${processes}" \
+      -o "GSUtil:check_hashes=always" \
+      rsync -x "${exclude}" gs://"${VM_METADATA[sap_hana_deployment_bucket]}" /hana/shared/media/ ; then
+    if [[ "${status}" = "cached" ]]; then
+      main::errhandle_log_warning "--- Unable to download the other objects in ${VM_METADATA[sap_hana_deployment_bucket]}. Continuing with the restored SAP HANA media"
+      return 0
+    fi
+    echo failed > /root/.deploy/hana_media.status
     main::errhandle_log_warning "HANA Media Download Failed. The deployment has finished and ready for SAP HANA, but SAP HANA will need to be downloaded and installed manually"
     main::complete
 	fi
+  echo "${status}" > /root/.deploy/hana_media.status
+
+  duration=$(echo "$(date +%s.%N) ${download_start}" | awk '{ printf "%.1f", $1 - $2 }')
+  bytes_downloaded=$(( $(du -sb /hana/shared/media | awk '{ print $1 }') - bytes_before ))
+  main::errhandle_log_info "--- Downloaded $((bytes_downloaded / 1024 / 1024)) MB in ${duration} seconds ($(echo "${bytes_downloaded} ${duration}" | awk '{ printf "%.0f MB/s, %.2f Gbps", $1 / ($2 + 0.001) / 1048576, $1 * 8 / ($2 + 0.001) / 1000000000 }'))"
 }
 
 
@@ -197,18 +282,184 @@ hdb::create_install_cfg() {
 }
 
 
+hdb::wait_for_media_part() {
+  local part=${1}
+  local size
+
+  ## a part is complete once gsutil has verified and renamed it and it has its listed size
+  size=$(grep "/${part}\$" /root/.deploy/hana_media.list | awk '{ print $1 }')
+  until [[ -f "${part}" ]] && [[ ! -f "${part}_.gstmp" ]] && [[ "$(stat -c %s "${part}")" = "${size}" ]]; do
+    if [[ -f /root/.deploy/hana_media.status ]]; then
+      ## download has finished without this part
+      return 1
+    fi
+    sleep 2
+  done
+}
+
+
+hdb::media_cache_key() {
+  local kind=${1}
+  local objects=${2}
+  local options=${3}
+  local hashes
+
+  if [[ -z "${VM_METADATA[sap_hana_media_cache]}" ]]; then
+    return 0
+  fi
+
+  ## the CRC32C of each source archive identifies its content without downloading it
+  hashes=$(${GSUTIL} ls -L "${objects}" 2>/dev/null | awk '/^gs:\/\// { name = $1 } /Hash \(crc32c\)/ { print name, $3 }' | awk -F"/" '{ print $NF }' | sort)
+  if [[ -n "${hashes}" ]]; then
+    echo "${kind}-$(echo "${hashes} ${options}" | sha256sum | cut -c1-32)"
+  fi
+}
+
+
+hdb::media_cache_exists() {
+  local key=${1}
+
+  if [[ -z "${key}" ]]; then
+    return 1
+  elif [[ "${VM_METADATA[sap_hana_media_cache]}" = gs://* ]]; then
+    ${GSUTIL} -q stat "${VM_METADATA[sap_hana_media_cache]%/}/${key}.tar"
+  else
+    [[ -f "${VM_METADATA[sap_hana_media_cache]%/}/${key}.tar" ]]
+  fi
+}
+
+
+hdb::media_cache_fetch() {
+  local key=${1}
+  local target=${2}
+
+  if ! hdb::media_cache_exists "${key}"; then
+    return 1
+  fi
+
+  main::errhandle_log_info "--- Restoring extracted media ${key} from ${VM_METADATA[sap_hana_media_cache]}"
+  mkdir -p "${target}"
+  if [[ "${VM_METADATA[sap_hana_media_cache]}" = gs://* ]]; then
+    ## stream the archive, so nothing is written twice
+    ( set -o pipefail; ${GSUTIL} -q cp "${VM_METADATA[sap_hana_media_cache]%/}/${key}.tar" - | tar -xf - -C "${target}" )
+  else
+    tar -xf "${VM_METADATA[sap_hana_media_cache]%/}/${key}.tar" -C "${target}"
+  fi
+}
+
+
+hdb::media_cache_store() {
+  local key=${1}
+  local source=${2}
+  shift 2
+  local cache=${VM_METADATA[sap_hana_media_cache]%/}
+
+  ## already stored, possibly by another deployment of the same media
+  if [[ -z "${key}" ]] || hdb::media_cache_exists "${key}"; then
+    return 0
+  fi
+
+  main::errhandle_log_info "--- Storing extracted media ${key} in ${VM_METADATA[sap_hana_media_cache]}"
+  if [[ "${cache}" = gs://* ]]; then
+    ## the object only becomes visible once the upload completes. A failed archive is removed again
+    if ! ( set -o pipefail; tar -cf - -C "${source}" "${@}" | ${GSUTIL} -q cp - "${cache}/${key}.tar" ); then
+      ${GSUTIL} -q rm "${cache}/${key}.tar" 2>/dev/null
+      main::errhandle_log_warning "--- Unable to store extracted media ${key} in ${VM_METADATA[sap_hana_media_cache]}"
+    fi
+  else
+    ## the rename makes a partially written archive invisible to other deployments
+    mkdir -p "${cache}"
+    if ! tar -cf "${cache}/.${key}.tar.$$" -C "${source}" "${@}" || ! mv "${cache}/.${key}.tar.$$" "${cache}/${key}.tar"; then
+      rm -f "${cache}/.${key}.tar.$$"
+      main::errhandle_log_warning "--- Unable to store extracted media ${key} in ${VM_METADATA[sap_hana_media_cache]}"
+    fi
+  fi
+}
+
+
+hdb::cache_media() {
+  ## nothing to store if the media was restored from the cache
+  if [[ -z "${VM_METADATA[sap_hana_media_cache_key]}" ]] || [[ "$(cat /root/.deploy/hana_media.status 2>/dev/null)" = "cached" ]]; then
+    return 0
+  fi
+  hdb::media_cache_store "${VM_METADATA[sap_hana_media_cache_key]}" /hana/shared/media "${VM_METADATA[sap_hana_media_number]}"
+}
+
+
 hdb::extract_media() {
+  local parts
+  local part
+  local feeder_pid
+  local masks=()
+  local component
 
   main::errhandle_log_info "Extracting SAP HANA media"
+  mkdir -p /hana/shared/media
   cd /hana/shared/media/ || main::errhandle_log_error "Unable to access /hana/shared/media. The server deployment is complete but SAP HANA is not deployed. Manual SAP HANA installation will be required."
 
+  if [[ -z "${VM_METADATA[sap_hana_media_number]}" ]] || [[ ! -f /root/.deploy/hana_media.list ]]; then
+    hdb::get_media_number
+  fi
+
+  ## only extract the requested components, e.g. HDB_LCM_LINUX_X86_64,HDB_SERVER_LINUX_X86_64
+  for component in ${VM_METADATA[sap_hana_extract_components]//,/ }; do
+    masks+=("${VM_METADATA[sap_hana_media_number]}/DATA_UNITS/${component}/*")
+  done
+  if [[ ${#masks[@]} -gt 0 ]]; then
+    main::errhandle_log_info "--- Extracting ${VM_METADATA[sap_hana_extract_components]} only"
+  fi
+
+  ## hdb::download_media restores the extracted media when it is cached
+  if [[ "${VM_METADATA[sap_hana_media_cached]}" = "yes" ]]; then
+    while [[ ! -f /root/.deploy/hana_media.status ]]; do
+      sleep 5
+    done
+    if [[ "$(cat /root/.deploy/hana_media.status)" = "cached" ]]; then
+      return 0
+    fi
+  fi
+
   ## Workaround requried due to unar not working with SAP HANA 2.0 SP3. TODO - Remove once no longer required
   if [[ -f /root/.deploy/unrar ]]; then
-    if ! /root/.deploy/unrar -o+ x "${VM_METADATA[sap_hana_media_number]}*part1.exe" >/dev/null; then
+    ## extract each volume as soon as it is downloaded. -vp makes unrar ask before opening every next volume,
+    ## and each answer is only sent once that volume is complete
+    parts=$(grep -o "${VM_METADATA[sap_hana_media_number]}_part[0-9]*\.\(exe\|rar\)$" /root/.deploy/hana_media.list | sort -V)
+    if hdb::wait_for_media_part "${VM_METADATA[sap_hana_media_number]}_part1.exe"; then
+      rm -f /root/.deploy/unrar.fifo
+      mkfifo /root/.deploy/unrar.fifo
+      {
+        for part in $(tail -n +2 <<< "${parts}"); do
+          hdb::wait_for_media_part "${part}" || break
+          echo C
+        done
+        echo Q
+      } > /root/.deploy/unrar.fifo &
+      feeder_pid=$!
+      if /root/.deploy/unrar x -o+ -vp "${VM_METADATA[sap_hana_media_number]}_part1.exe" "${masks[@]}" < /root/.deploy/unrar.fifo >/dev/null; then
+        wait "${feeder_pid}"
+        rm -f /root/.deploy/unrar.fifo
+        return 0
+      fi
+      kill "${feeder_pid}" 2>/dev/null
+      rm -f /root/.deploy/unrar.fifo
+    fi
+    main::errhandle_log_info "--- Extraction while downloading did not complete. Extracting the downloaded media"
+  fi
+
+  ## the remaining methods need every volume
+  while [[ ! -f /root/.deploy/hana_media.status ]]; do
+    sleep 5
+  done
+  if [[ "$(cat /root/.deploy/hana_media.status)" != "done" ]]; then
+    main::errhandle_log_error "HANA media download failed. Please ensure the correct media is uploaded to your GCS bucket"
+  fi
+
+  if [[ -f /root/.deploy/unrar ]]; then
+    if ! /root/.deploy/unrar -o+ x "${VM_METADATA[sap_hana_media_number]}*part1.exe" "${masks[@]}" >/dev/null; then
       main::errhandle_log_error "HANA media extraction failed. Please ensure the correct media is uploaded to your GCS bucket"
     fi
   elif [ "${LINUX_DISTRO}" = "SLES" ]; then
-    if ! unrar -o+ x "*part1.exe" >/dev/null; then
+    if ! unrar -o+ x "*part1.exe" "${masks[@]}" >/dev/null; then
       main::errhandle_log_error "HANA media extraction failed. Please ensure the correct media is uploaded to your GCS bucket"
     fi
   elif [ "${LINUX_DISTRO}" = "RHEL" ]; then
@@ -231,12 +482,21 @@ hdb::install() {
 
 
 hdb::upgrade(){
-	if [ "$(ls /hana/shared/media/IMDB_SERVER*.SAR)" ]; then
+	local key
+
+	## hdb::download_media leaves IMDB_SERVER*.SAR in the bucket, so look for it there
+	if [[ "$(${GSUTIL} ls gs://"${VM_METADATA[sap_hana_deployment_bucket]}"/IMDB_SERVER*.SAR 2>/dev/null)" ]]; then
 	  main::errhandle_log_info "An SAP HANA update was found in GCS. Performing the upgrade:"
-	  main::errhandle_log_info "--- Extracting HANA upgrade media"
-		cd /hana/shared/media || main::errhandle_log_error "Unable to access /hana/shared/media. The server deployment is complete but SAP HANA is not deployed. Manual SAP HANA installation will be required."
-		/usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/exe/hdb/SAPCAR -xvf "IMDB_SERVER*.SAR"
-		cd SAP_HANA_DATABASE || main::errhandle_log_error "Unable to access /hana/shared/media. The server deployment is complete but SAP HANA is not deployed. Manual SAP HANA installation will be required."
+		key=$(hdb::media_cache_key hana_upgrade "gs://${VM_METADATA[sap_hana_deployment_bucket]}/IMDB_SERVER*.SAR")
+		if ! hdb::media_cache_fetch "${key}" /hana/shared/media; then
+		  main::errhandle_log_info "--- Downloading HANA upgrade media"
+		  ${GSUTIL} cp gs://"${VM_METADATA[sap_hana_deployment_bucket]}"/IMDB_SERVER*.SAR /hana/shared/media/
+		  main::errhandle_log_info "--- Extracting HANA upgrade media"
+		  cd /hana/shared/media || main::errhandle_log_error "Unable to access /hana/shared/media. The server deployment is complete but SAP HANA is not deployed. Manual SAP HANA installation will be required."
+		  /usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/exe/hdb/SAPCAR -xvf "IMDB_SERVER*.SAR"
+		  hdb::media_cache_store "${key}" /hana/shared/media SAP_HANA_DATABASE
+		fi
+		cd /hana/shared/media/SAP_HANA_DATABASE || main::errhandle_log_error "Unable to access /hana/shared/media. The server deployment is complete but SAP HANA is not deployed. Manual SAP HANA installation will be required."
 	  main::errhandle_log_info "--- Upgrading Database"
 		if ! ./hdblcm --configfile=/root/.deploy/"${HOSTNAME}"_hana_install.cfg --action=update --ignore=check_signature_file --update_execution_mode=optimized --batch; then
 		    main::errhandle_log_warning "SAP HANA Database revision upgrade failed to install."
@@ -246,14 +506,20 @@ hdb::upgrade(){
 
 
 hdb::install_afl() {
+  local key
+
   if [[ "$(${GSUTIL} ls gs://"${VM_METADATA[sap_hana_deployment_bucket]}"/IMDB_AFL*)" ]]; then
     main::errhandle_log_info "SAP AFL was found in GCS. Installing SAP AFL addon"
-    main::errhandle_log_info "--- Downloading AFL media"
-    ${GSUTIL} cp gs://"${VM_METADATA[sap_hana_deployment_bucket]}"/IMDB_AFL*.SAR /hana/shared/media/
-    main::errhandle_log_info "--- Extracting AFL media"
-    cd /hana/shared/media || main::errhandle_log_warning "AFL failed to install"
-    /usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/exe/hdb/SAPCAR -xvf "IMDB_AFL*.SAR"
-    cd SAP_HANA_AFL || main::errhandle_log_warning "AFL failed to install"
+    key=$(hdb::media_cache_key hana_afl "gs://${VM_METADATA[sap_hana_deployment_bucket]}/IMDB_AFL*.SAR")
+    if ! hdb::media_cache_fetch "${key}" /hana/shared/media; then
+      main::errhandle_log_info "--- Downloading AFL media"
+      ${GSUTIL} cp gs://"${VM_METADATA[sap_hana_deployment_bucket]}"/IMDB_AFL*.SAR /hana/shared/media/
+      main::errhandle_log_info "--- Extracting AFL media"
+      cd /hana/shared/media || main::errhandle_log_warning "AFL failed to install"
+      /usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/exe/hdb/SAPCAR -xvf "IMDB_AFL*.SAR"
+      hdb::media_cache_store "${key}" /hana/shared/media SAP_HANA_AFL
+    fi
+    cd /hana/shared/media/SAP_HANA_AFL || main::errhandle_log_warning "AFL failed to install"
     main::errhandle_log_info "--- Installing AFL"
     ./hdbinst --sid="${VM_METADATA[sap_hana_sid]}"
   fi
@@ -267,14 +533,104 @@ hdb::set_parameters() {
   local value=${4}
   local tenant=${5}
 
-  # if tenant specified, run it on that tenant. Else do it in SYSTEMDB. If that fails (HANA 2.0 SP0 <) then run it without specifying a tenant
-  if [[ -n ${tenant} ]]; then
-    bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d ${tenant} -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} \"ALTER SYSTEM ALTER CONFIGURATION ('$inifile', 'SYSTEM') SET ('$section','$setting') = '$value' with reconfigure\""
-  else
-    if ! bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} \"ALTER SYSTEM ALTER CONFIGURATION ('$inifile', 'SYSTEM') SET ('$section','$setting') = '$value' with reconfigure\""; then
-      bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} \"ALTER SYSTEM ALTER CONFIGURATION ('$inifile', 'SYSTEM') SET ('$section','$setting') = '$value' with reconfigure\""
+  hdb::queue_parameters "${inifile}" "${section}" "${setting}" "${value}" "${tenant}"
+  hdb::apply_parameters
+}
+
+
+hdb::queue_parameters() {
+  local inifile=${1}
+  local section=${2}
+  local setting=${3}
+  local value=${4}
+  local tenant=${5}
+
+  ## queued settings are applied together by hdb::apply_parameters
+  HDB_PARAMETER_QUEUE+=("${tenant}|${inifile}|${section}|${setting}|${value}")
+}
+
+
+hdb::run_parameter_batch() {
+  local database=${1}
+  local sqlfile=${2}
+
+  bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql ${database:+-d ${database}} -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} -a -x -c '#' -I ${sqlfile}"
+}
+
+
+hdb::has_systemdb() {
+  ## HANA 2.0 SP0 and earlier have no SYSTEMDB. The answer is kept once either database has answered the probe, so a
+  ## failed statement or a database that is not up yet does not send settings to the wrong database
+  if [[ -z "${HDB_SYSTEMDB}" ]]; then
+    if bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} -a -x \"SELECT 1 FROM DUMMY\"" >/dev/null 2>&1; then
+      HDB_SYSTEMDB=yes
+    elif bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} -a -x \"SELECT 1 FROM DUMMY\"" >/dev/null 2>&1; then
+      HDB_SYSTEMDB=no
+    else
+      main::errhandle_log_warning "--- Unable to connect to SAP HANA. Assuming it has a SYSTEMDB"
+      return 0
     fi
   fi
+  [[ "${HDB_SYSTEMDB}" = "yes" ]]
+}
+
+
+hdb::apply_parameters() {
+  local tenant
+  local entry
+  local entry_tenant
+  local inifile
+  local section
+  local setting
+  local value
+  local sqlfile
+  local results
+  local failed=0
+
+  if [[ ${#HDB_PARAMETER_QUEUE[@]} -eq 0 ]]; then
+    return 0
+  fi
+  mkdir -p /root/.deploy
+
+  ## one hdbsql session per tenant. Settings without a tenant are made in SYSTEMDB
+  while IFS= read -r tenant; do
+    sqlfile=/root/.deploy/hana_parameters${tenant:+_${tenant}}.sql
+    : > "${sqlfile}"
+    for entry in "${HDB_PARAMETER_QUEUE[@]}"; do
+      IFS='|' read -r entry_tenant inifile section setting value <<< "${entry}"
+      if [[ "${entry_tenant}" = "${tenant}" ]]; then
+        echo "ALTER SYSTEM ALTER CONFIGURATION ('${inifile}', 'SYSTEM') SET ('${section}','${setting}') = '${value//\'/\'\'}' WITH RECONFIGURE#" >> "${sqlfile}"
+      fi
+    done
+    ## read the configuration back in the same session to report the result of each statement
+    echo "SELECT FILE_NAME, SECTION, KEY, VALUE FROM M_INIFILE_CONTENTS WHERE LAYER_NAME = 'SYSTEM'#" >> "${sqlfile}"
+
+    results=""
+    if [[ -n ${tenant} ]]; then
+      results=$(hdb::run_parameter_batch "${tenant}" "${sqlfile}")
+    else
+      if hdb::has_systemdb; then
+        results=$(hdb::run_parameter_batch SYSTEMDB "${sqlfile}")
+      else
+        results=$(hdb::run_parameter_batch "" "${sqlfile}")
+      fi
+    fi
+
+    for entry in "${HDB_PARAMETER_QUEUE[@]}"; do
+      IFS='|' read -r entry_tenant inifile section setting value <<< "${entry}"
+      if [[ "${entry_tenant}" = "${tenant}" ]]; then
+        if grep -Fxqi "\"${inifile}\",\"${section}\",\"${setting}\",\"${value}\"" <<< "${results}"; then
+          main::errhandle_log_info "--- Set ${inifile} [${section}] ${setting} = ${value}${tenant:+ in ${tenant}}"
+        else
+          main::errhandle_log_warning "--- Unable to set ${inifile} [${section}] ${setting} = ${value}${tenant:+ in ${tenant}}"
+          failed=1
+        fi
+      fi
+    done
+  done < <(printf '%s\n' "${HDB_PARAMETER_QUEUE[@]}" | cut -d'|' -f1 | sort -u)
+
+  HDB_PARAMETER_QUEUE=()
+  return ${failed}
 }
 
 
@@ -283,8 +639,9 @@ hdb::config_backup() {
   mkdir -p /hanabackup/data/"${VM_METADATA[sap_hana_sid]}" /hanabackup/log/"${VM_METADATA[sap_hana_sid]}"
   chown -R root:sapsys /hanabackup
   chmod -R g=wrx /hanabackup
-  hdb::set_parameters global.ini persistence basepath_databackup /hanabackup/data/"${VM_METADATA[sap_hana_sid]}"
-  hdb::set_parameters global.ini persistence basepath_logbackup /hanabackup/log/"${VM_METADATA[sap_hana_sid]}"
+  hdb::queue_parameters global.ini persistence basepath_databackup /hanabackup/data/"${VM_METADATA[sap_hana_sid]}"
+  hdb::queue_parameters global.ini persistence basepath_logbackup /hanabackup/log/"${VM_METADATA[sap_hana_sid]}"
+  hdb::apply_parameters
 }
 
 
@@ -365,6 +722,11 @@ hdb::config_nfs() {
 
 		## manually exporting file systems
 		exportfs -rav
+
+		## wake up the workers waiting in hdb::mount_nfs
+		if ! main::barrier_arrive nfs_ready $(seq -f "${HOSTNAME}w%g" 1 "${VM_METADATA[sap_hana_scaleout_nodes]}"); then
+		  main::errhandle_log_warning "--- Workers that weren't signalled will mount the NFS volumes after their 20 minute wait"
+		fi
 	fi
 }
 
@@ -378,18 +740,15 @@ hdb::install_scaleout_nodes() {
 
     ## Check each host is online and ssh'able before contining
     local worker
-		local count=0
+    local workers=()
 
-		for worker in $(seq 1 "${VM_METADATA[sap_hana_scaleout_nodes]}"); do
-			while ! ssh -o StrictHostKeyChecking=no "${HOSTNAME}"w"${worker}" "echo 1"; do
-				count=$((count +1))
-				main::errhandle_log_info "--- ${HOSTNAME}w${worker} is not accessible via SSH - sleeping for 10 seconds and trying again"
-				sleep 10
-				if [ $count -gt 60 ]; then
-					main::errhandle_log_error "Unable to add additional HANA hosts. Couldn't connect to additional ${HOSTNAME}w${worker} via SSH"
-				fi
-			done
-		done
+    for worker in $(seq 1 "${VM_METADATA[sap_hana_scaleout_nodes]}"); do
+      workers+=("${HOSTNAME}w${worker}")
+    done
+    main::barrier_wait worker_ready 1200 "${workers[@]}"
+    if ! hdb::wait_for_ssh "${workers[@]}"; then
+      main::errhandle_log_error "Unable to add additional HANA hosts. Couldn't connect to all additional hosts via SSH"
+    fi
 
 		## get passwords from install file
 		local hana_xml="<?xml version=\"1.0\" encoding=\"UTF-8\"?><Passwords>"
@@ -399,12 +758,9 @@ hdb::install_scaleout_nodes() {
 
     cd /hana/shared/"${VM_METADATA[sap_hana_sid]}"/hdblcm || main::errhandle_log_info "Unable to access hdblcm. The server deployment is complete but SAP HANA is not deployed. Manual SAP HANA installation will be required."
 
-		for worker in $(seq 1 "${VM_METADATA[sap_hana_scaleout_nodes]}"); do
-      main::errhandle_log_info "--- Adding node ${HOSTNAME}w${worker}"
-      if ! echo "$hana_xml" | ./hdblcm --action=add_hosts --addhosts="${HOSTNAME}"w"${worker}" --root_user=root --listen_interface=global --read_password_from_stdin=xml -b; then
-        main::errhandle_log_error "Unable to access hdblcm. The server deployment is complete but SAP HANA is not deployed. Manual SAP HANA installation will be required."
-      fi
-    done
+    if ! hdb::add_hosts "${hana_xml}" "${workers[@]}"; then
+      main::errhandle_log_error "Unable to add all additional HANA hosts. The server deployment is complete but SAP HANA is not fully deployed. Manual SAP HANA installation will be required."
+    fi
 
     ## Post deployment & installation cleanup
     main::complete
@@ -412,13 +768,97 @@ hdb::install_scaleout_nodes() {
 }
 
 
+hdb::wait_for_ssh() {
+  local host
+  local pids=()
+  local pid
+  local failed=0
+
+  ## hosts boot in parallel, so check them in parallel
+  for host in "${@}"; do
+    (
+      local count=0
+      while ! ssh -o StrictHostKeyChecking=no "${host}" "echo 1" >/dev/null; do
+        count=$((count +1))
+        main::errhandle_log_info "--- ${host} is not accessible via SSH - sleeping for 10 seconds and trying again"
+        sleep 10
+        if [ ${count} -gt 60 ]; then
+          exit 1
+        fi
+      done
+    ) &
+    pids+=($!)
+  done
+
+  for pid in "${pids[@]}"; do
+    if ! wait "${pid}"; then
+      failed=1
+    fi
+  done
+  return ${failed}
+}
+
+
+hdb::host_added() {
+  local host=${1}
+
+  /usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/exe/hdb/sapcontrol -prot NI_HTTP -nr "${VM_METADATA[sap_hana_instance_number]}" -function GetSystemInstanceList | grep -q "^${host}, "
+}
+
+
+hdb::add_hosts() {
+  local hana_xml=${1}
+  shift
+  local hosts=("${@}")
+  local remaining=()
+  local host
+  local half
+  local added=()
+  local failed=0
+  local start
+
+  if [[ ${#hosts[@]} -eq 0 ]]; then
+    return 0
+  fi
+
+  ## hdblcm adds all hosts of one call in parallel. Calls can't overlap as hdblcm locks the system
+  main::errhandle_log_info "--- Adding $(IFS=,; echo "${hosts[*]}")"
+  start=$(date +%s)
+  if echo "${hana_xml}" | /hana/shared/"${VM_METADATA[sap_hana_sid]}"/hdblcm/hdblcm --action=add_hosts --addhosts="$(IFS=,; echo "${hosts[*]}")" --root_user=root --listen_interface=global --read_password_from_stdin=xml -b; then
+    main::errhandle_log_info "--- hdblcm added ${#hosts[@]} hosts in $(( $(date +%s) - start )) seconds"
+    return 0
+  fi
+
+  ## retry the hosts that were not added in two halves, so a failing host doesn't hold back the others
+  for host in "${hosts[@]}"; do
+    if hdb::host_added "${host%%:*}"; then
+      added+=("${host%%:*}")
+    else
+      remaining+=("${host}")
+    fi
+  done
+  main::errhandle_log_warning "--- hdblcm failed after $(( $(date +%s) - start )) seconds, having added ${#added[@]} of ${#hosts[@]} hosts${added[*]:+: $(IFS=,; echo "${added[*]}")}"
+  if [[ ${#hosts[@]} -eq 1 ]] && [[ ${#remaining[@]} -eq 1 ]]; then
+    main::errhandle_log_warning "--- Unable to add ${hosts[0]%%:*}"
+    return 1
+  fi
+  half=$(( (${#remaining[@]} + 1) / 2 ))
+  hdb::add_hosts "${hana_xml}" "${remaining[@]:0:${half}}" || failed=1
+  hdb::add_hosts "${hana_xml}" "${remaining[@]:${half}}" || failed=1
+  return ${failed}
+}
+
+
 hdb::mount_nfs() {
   main::errhandle_log_info 'Mounting NFS volumes /hana/shared & /hanabackup'
   echo "$(hostname | rev | cut -d"w" -f2-999 | rev):/hana/shared /hana/shared nfs	nfsvers=3,rsize=32768,wsize=32768,hard,intr,timeo=18,retrans=200 0 0" >>/etc/fstab
   echo "$(hostname | rev | cut -d"w" -f2-999 | rev):/hanabackup /hanabackup nfs	nfsvers=3,rsize=32768,wsize=32768,hard,intr,timeo=18,retrans=200 0 0" >>/etc/fstab
 
   mkdir -p /hana/shared /hanabackup
-  
+
+  ## released as soon as the master has exported the file systems
+  main::barrier_wait nfs_ready 1200 "${hana_master_node}"
+
   ## mount file systems
   mount -a
 
@@ -439,6 +879,11 @@ hdb::mount_nfs() {
 hdb::backup() {
   local backup_name=${1}
 
+  ## near instant full backup from disk snapshots instead of copying the data to /hanabackup
+  if [[ "${VM_METADATA[sap_hana_backup_mode]}" = "snapshot" ]] && hdb::snapshot_backup "${backup_name}"; then
+    return 0
+  fi
+
   main::errhandle_log_info "Creating HANA backup ${backup_name}"
   PATH="$PATH:/usr/sap/${VM_METADATA[sap_hana_sid]}/HDB${VM_METADATA[sap_hana_instance_number]}/exe"
 
@@ -448,6 +893,141 @@ hdb::backup() {
 }
 
 
+hdb::get_data_disks() {
+  local pv
+  local link
+
+  ## scale-out data volumes are on the <master>-mnt000NN disks, whichever host they are attached to
+  if [[ -n "${VM_METADATA[sap_hana_shared_nfs]}" ]] || [[ -n "${VM_METADATA[sap_hana_standby_nodes]}" ]]; then
+    ${GCLOUD} --quiet compute disks list --filter="name~^${hana_master_node:-${HOSTNAME}}-mnt[0-9]+$ AND zone:(${CLOUDSDK_COMPUTE_ZONE})" --format="value(name)"
+    return 0
+  fi
+
+  ## the device names of the disks holding vg_hana are the disk names
+  for pv in $(pvs --noheadings -o pv_name -S vg_name=vg_hana); do
+    for link in /dev/disk/by-id/google-*; do
+      if [[ ! "${link}" = *-part* ]] && [[ "$(readlink -f "${link}")" = "$(readlink -f "${pv}")" ]]; then
+        echo "${link##*/google-}"
+      fi
+    done
+  done
+}
+
+
+hdb::snapshot_backup() {
+  local backup_name=${1}
+  local snapshot_name
+  local backup_id
+  local disks
+  local disk
+  local pids=()
+  local pid
+  local failed=0
+  local backup_start=${SECONDS}
+
+  ## snapshot names may only contain lowercase letters, numbers and hyphens
+  snapshot_name=$(basename "${backup_name}" | tr '[:upper:]_' '[:lower:]-' | tr -cd 'a-z0-9-')
+
+  main::errhandle_log_info "Creating HANA snapshot backup ${snapshot_name}"
+  disks=$(hdb::get_data_disks)
+  if [[ -z "${disks}" ]]; then
+    main::errhandle_log_warning "--- Unable to find the disks holding the SAP HANA data volumes"
+    return 1
+  fi
+
+  if ! bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} \"BACKUP DATA FOR FULL SYSTEM CREATE SNAPSHOT COMMENT '${snapshot_name}'\""; then
+    main::errhandle_log_warning "--- Unable to prepare a SAP HANA database snapshot"
+    return 1
+  fi
+  backup_id=$(bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} -a -x \"SELECT BACKUP_ID FROM M_BACKUP_CATALOG WHERE ENTRY_TYPE_NAME = 'data snapshot' AND STATE_NAME = 'prepared'\"" | head -1)
+
+  ## each disk snapshot is crash consistent, and the prepared database snapshot makes them consistent with each other
+  for disk in ${disks}; do
+    ${GCLOUD} --quiet compute disks snapshot "${disk}" --zone "${CLOUDSDK_COMPUTE_ZONE}" --snapshot-names "${disk}-${snapshot_name}" --description "SAP HANA ${VM_METADATA[sap_hana_sid]} data snapshot, backup ID ${backup_id}" >/dev/null &
+    pids+=($!)
+  done
+  for pid in "${pids[@]}"; do
+    if ! wait "${pid}"; then
+      failed=1
+    fi
+  done
+
+  ## record the result in the backup catalog. Only successful snapshots can be recovered
+  if [[ ${failed} -ne 0 ]]; then
+    bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} \"BACKUP DATA FOR FULL SYSTEM CLOSE SNAPSHOT BACKUP_ID ${backup_id} UNSUCCESSFUL 'disk snapshot failed'\""
+    main::errhandle_log_warning "--- Unable to snapshot all of $(echo ${disks}). HANA snapshot backup ${snapshot_name} failed"
+    return 1
+  fi
+  bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} \"BACKUP DATA FOR FULL SYSTEM CLOSE SNAPSHOT BACKUP_ID ${backup_id} SUCCESSFUL '${snapshot_name}'\""
+  main::errhandle_log_info "--- HANA snapshot backup ${snapshot_name} (backup ID ${backup_id}) of $(echo ${disks}) created in $((SECONDS - backup_start)) seconds"
+}
+
+
+hdb::mount_snapshot() {
+  local snapshot=${1}
+  local mount_point=${2}
+  local disk=${HOSTNAME}-restore
+
+  if ! ${GCLOUD} --quiet compute disks create "${disk}" --source-snapshot "${snapshot}" --type pd-ssd --zone "${CLOUDSDK_COMPUTE_ZONE}" || \
+     ! ${GCLOUD} --quiet compute instances attach-disk "${HOSTNAME}" --disk "${disk}" --device-name "${disk}" --zone "${CLOUDSDK_COMPUTE_ZONE}"; then
+    ${GCLOUD} --quiet compute disks delete "${disk}" --zone "${CLOUDSDK_COMPUTE_ZONE}"
+    return 1
+  fi
+  ${GCLOUD} --quiet compute instances set-disk-auto-delete "${HOSTNAME}" --disk "${disk}" --zone "${CLOUDSDK_COMPUTE_ZONE}"
+
+  ## the volume group on the snapshot has the same name and UUIDs as the one it was taken from. Import it under a new name
+  udevadm settle
+  vgimportclone -n vg_restore /dev/disk/by-id/google-"${disk}"
+  vgchange -ay vg_restore
+  mkdir -p "${mount_point}"
+  if ! mount -o ro,nouuid /dev/vg_restore/data "${mount_point}"; then
+    hdb::unmount_snapshot "${mount_point}"
+    return 1
+  fi
+}
+
+
+hdb::unmount_snapshot() {
+  local mount_point=${1}
+  local disk=${HOSTNAME}-restore
+
+  umount "${mount_point}" 2>/dev/null
+  vgchange -an vg_restore
+  ${GCLOUD} --quiet compute instances detach-disk "${HOSTNAME}" --disk "${disk}" --zone "${CLOUDSDK_COMPUTE_ZONE}"
+  ${GCLOUD} --quiet compute disks delete "${disk}" --zone "${CLOUDSDK_COMPUTE_ZONE}"
+}
+
+
+hdb::restore_snapshot_backup() {
+  local backup_name=${1}
+  local snapshot
+  local tenant
+
+  ## single host systems only. The data volume is on the first disk of vg_hana
+  snapshot="$(hdb::get_data_disks | head -1)-$(basename "${backup_name}" | tr '[:upper:]_' '[:lower:]-' | tr -cd 'a-z0-9-')"
+  main::errhandle_log_info "Restoring HANA snapshot backup ${snapshot}"
+
+  hdb::stop
+  if ! hdb::mount_snapshot "${snapshot}" /mnt/hana_restore; then
+    main::errhandle_log_error "Unable to mount snapshot ${snapshot}. SAP HANA has been stopped and needs to be restored manually"
+  fi
+  rm -rf /hana/data/"${VM_METADATA[sap_hana_sid]}"/*
+  if ! cp -a /mnt/hana_restore/"${VM_METADATA[sap_hana_sid]}"/. /hana/data/"${VM_METADATA[sap_hana_sid]}"/; then
+    hdb::unmount_snapshot /mnt/hana_restore
+    main::errhandle_log_error "Unable to copy the data volumes from ${snapshot}. SAP HANA has been stopped and needs to be restored manually"
+  fi
+  hdb::unmount_snapshot /mnt/hana_restore
+
+  ## recover SYSTEMDB and then each tenant from the restored data area
+  main::errhandle_log_info "--- Recovering SYSTEMDB"
+  su - "${VM_METADATA[sap_hana_sid],,}"adm -c "HDBSettings.sh recoverSys.py --command=\"RECOVER DATA USING SNAPSHOT CLEAR LOG\" --wait"
+  for tenant in $(bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} -a -x \"SELECT DATABASE_NAME FROM M_DATABASES WHERE DATABASE_NAME <> 'SYSTEMDB'\"" | tr -d '"'); do
+    main::errhandle_log_info "--- Recovering ${tenant}"
+    bash -c "source /usr/sap/${VM_METADATA[sap_hana_sid]}/home/.sapenv.sh && hdbsql -d SYSTEMDB -u SYSTEM -p ${VM_METADATA[sap_hana_system_password]} -i ${VM_METADATA[sap_hana_instance_number]} \"RECOVER DATA FOR ${tenant} USING SNAPSHOT CLEAR LOG\""
+  done
+}
+
+
 hdb::execute_sql() {
     local host="${0}"
     local instance_number="${0}"
@@ -524,11 +1104,18 @@ hdb::config_backint() {
 
   ## Set SAP HANA parameters
   main::errhandle_log_info "--- Configuring SAP HANA to use BackInt"
-  hdb::set_parameters global.ini backup data_backup_parameter_file /usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/global/hdb/opt/hdbconfig/parameters.txt
-  hdb::set_parameters global.ini backup log_backup_parameter_file /usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/global/hdb/opt/hdbconfig/parameters.txt
-  hdb::set_parameters global.ini backup catalog_backup_parameter_file /usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/global/hdb/opt/hdbconfig/parameters.txt
-  hdb::set_parameters global.ini backup log_backup_using_backint true
-  hdb::set_parameters global.ini backup catalog_backup_using_backint true
+  hdb::queue_parameters global.ini backup data_backup_parameter_file /usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/global/hdb/opt/hdbconfig/parameters.txt
+  hdb::queue_parameters global.ini backup log_backup_parameter_file /usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/global/hdb/opt/hdbconfig/parameters.txt
+  hdb::queue_parameters global.ini backup catalog_backup_parameter_file /usr/sap/"${VM_METADATA[sap_hana_sid]}"/SYS/global/hdb/opt/hdbconfig/parameters.txt
+  hdb::queue_parameters global.ini backup catalog_backup_using_backint true
+
+  ## log backups staged on /hanabackup are written to file and uploaded by hdb::config_log_staging
+  if [[ "${VM_METADATA[sap_hana_log_backup_staging],,}" =~ ^(yes|true)$ ]]; then
+    hdb::queue_parameters global.ini backup log_backup_using_backint false
+    hdb::queue_parameters global.ini persistence basepath_logbackup /hanabackup/log/"${VM_METADATA[sap_hana_sid]}"
+  else
+    hdb::queue_parameters global.ini backup log_backup_using_backint true
+  fi
 
   ## Calculate number of channels based on instanec size + Configure in SAP HANA
   local backup_channels
@@ -537,10 +1124,241 @@ hdb::config_backint() {
     backup_channels=16
   fi
 
-  hdb::set_parameters global.ini backup parallel_data_backup_backint_channels "${backup_channels}"
+  hdb::queue_parameters global.ini backup parallel_data_backup_backint_channels "${backup_channels}"
 
   ## Set catalog location
-  hdb::set_parameters global.ini persistence 'basepath_catalogbackup' /hanabackup/log/"${VM_METADATA[sap_hana_sid]}"
+  hdb::queue_parameters global.ini persistence 'basepath_catalogbackup' /hanabackup/log/"${VM_METADATA[sap_hana_sid]}"
+  hdb::apply_parameters
+
+  if [[ "${VM_METADATA[sap_hana_log_backup_staging],,}" =~ ^(yes|true)$ ]]; then
+    hdb::config_log_staging "${backup_bucket}"
+  fi
+
+  ## optionally measure the channels, chunk size and compression that back up fastest from this VM to the bucket
+  if [[ "${VM_METADATA[sap_hana_backint_tune],,}" =~ ^(yes|true)$ ]]; then
+    hdb::tune_backint "${backup_bucket}"
+  fi
+}
+
+
+hdb::tune_backint() {
+  local backup_bucket=${1}
+  local sid=${VM_METADATA[sap_hana_sid]}
+  local parameters=/usr/sap/${sid}/SYS/global/hdb/opt/hdbconfig/parameters.txt
+  local backint=/usr/sap/${sid}/SYS/global/hdb/opt/hdbbackint
+  local tune_dir=/hanabackup/backint_tuning
+  local results=/root/.deploy/${HOSTNAME}_backint_tuning.csv
+  local stream_mb=${VM_METADATA[sap_hana_backint_tune_size]:-256}
+  local max_channels=$(( VM_CPUCOUNT < 16 ? VM_CPUCOUNT : 16 ))
+  local sample
+  local nonzero
+  local compressions="yes no"
+  local channel_counts
+  local channels
+  local chunk
+  local compression
+  local stream
+  local start
+  local duration
+  local rate
+  local best_rate=0
+  local best
+  local -a pids
+
+  main::errhandle_log_info "Tuning SAP HANA Backint throughput to gs://${backup_bucket}"
+
+  ## a sample of the data volume compresses like a real backup. Without one, use base64 encoded random data
+  mkdir -p "${tune_dir}"
+  sample=$(ls /hana/data/"${sid}"/mnt00001/hdb*/datavolume_0000.dat 2>/dev/null | tail -1)
+  if [[ -n "${sample}" ]]; then
+    dd if="${sample}" of="${tune_dir}"/sample bs=1M count="${stream_mb}" status=none
+  fi
+  if [[ ! -s "${tune_dir}"/sample ]]; then
+    head -c $((stream_mb * 786432)) /dev/urandom | base64 -w 0 > "${tune_dir}"/sample
+    compressions=current
+  fi
+
+  ## a freshly installed data volume is mostly empty pages and base64 text compresses well, so neither
+  ## would show what compression costs on real data. Only compare compression on a mostly used volume
+  nonzero=$(tr -d '\0' < "${tune_dir}"/sample | wc -c)
+  if [[ $(( nonzero * 10 )) -lt $(( $(stat -c %s "${tune_dir}"/sample) * 9 )) ]]; then
+    compressions=current
+  fi
+  if [[ "${compressions}" = "current" ]]; then
+    main::errhandle_log_info "--- The test data isn't representative of a backup. Leaving compression at its current setting"
+  fi
+  chown -R "${sid,,}"adm:sapsys "${tune_dir}"
+
+  channel_counts=$(for channels in 2 4 8 16; do [[ ${channels} -le ${max_channels} ]] && echo "${channels}"; done)
+  echo "channels,chunk_size_mb,compression,bytes,seconds,mb_per_second" > "${results}"
+
+  for channels in ${channel_counts:-1}; do
+    for chunk in 256 1024; do
+      for compression in ${compressions}; do
+        ## parameters for this run, based on the configured file
+        sed -e '/^\\\?#CHUNK_SIZE_MB/d' "${parameters}" > "${tune_dir}"/parameters.txt
+        if [[ "${compression}" != "current" ]]; then
+          sed -i -e '/^\\\?#DISABLE_COMPRESSION/d' "${tune_dir}"/parameters.txt
+        fi
+        echo "#CHUNK_SIZE_MB ${chunk}" >> "${tune_dir}"/parameters.txt
+        if [[ "${compression}" = "no" ]]; then
+          echo "#DISABLE_COMPRESSION" >> "${tune_dir}"/parameters.txt
+        fi
+
+        ## one pipe per channel, fed from the sample like HANA feeds backint
+        : > "${tune_dir}"/input
+        pids=()
+        for stream in $(seq 1 "${channels}"); do
+          rm -f "${tune_dir}"/stream_"${stream}"
+          mkfifo -m 0660 "${tune_dir}"/stream_"${stream}"
+          chown "${sid,,}"adm:sapsys "${tune_dir}"/stream_"${stream}"
+          echo "#PIPE \"${tune_dir}/stream_${stream}\"" >> "${tune_dir}"/input
+          cat "${tune_dir}"/sample > "${tune_dir}"/stream_"${stream}" &
+          pids+=($!)
+        done
+        chown "${sid,,}"adm:sapsys "${tune_dir}"/input "${tune_dir}"/parameters.txt
+
+        start=$(date +%s.%N)
+        if ! su - "${sid,,}"adm -c "${backint} -u ${sid} -f backup -t file -l FULL -c ${channels} -p ${tune_dir}/parameters.txt -i ${tune_dir}/input -o ${tune_dir}/output" >/dev/null 2>&1; then
+          main::errhandle_log_warning "--- Backint test backup with ${channels} channels, ${chunk} MB chunks, compression ${compression} failed"
+        fi
+        duration=$(echo "$(date +%s.%N) ${start}" | awk '{ printf "%.1f", $1 - $2 }')
+        ## stop feeders of pipes backint did not read
+        for stream in $(seq 1 "${channels}"); do
+          timeout 1 cat "${tune_dir}"/stream_"${stream}" >/dev/null 2>&1
+        done
+        wait "${pids[@]}"
+
+        ## only count runs where every stream was saved
+        if [[ $(grep -c '^#SAVED' "${tune_dir}"/output 2>/dev/null) -eq ${channels} ]]; then
+          rate=$(echo "$(stat -c %s "${tune_dir}"/sample) ${channels} ${duration}" | awk '{ printf "%.0f", $1 * $2 / ($3 + 0.001) / 1048576 }')
+        else
+          rate=0
+        fi
+        echo "${channels},${chunk},${compression},$(( $(stat -c %s "${tune_dir}"/sample) * channels )),${duration},${rate}" >> "${results}"
+        main::errhandle_log_info "--- ${channels} channels, ${chunk} MB chunks, compression ${compression}: ${rate} MB/s"
+        if [[ ${rate} -gt ${best_rate} ]]; then
+          best_rate=${rate}
+          best="${channels} ${chunk} ${compression}"
+        fi
+
+        ## remove the test backup from the bucket
+        grep '^#SAVED' "${tune_dir}"/output 2>/dev/null | awk '{ print "#EBID", $2, $3 }' > "${tune_dir}"/delete
+        if [[ -s "${tune_dir}"/delete ]]; then
+          chown "${sid,,}"adm:sapsys "${tune_dir}"/delete
+          su - "${sid,,}"adm -c "${backint} -u ${sid} -f delete -t file -p ${tune_dir}/parameters.txt -i ${tune_dir}/delete -o ${tune_dir}/deleted" >/dev/null 2>&1
+        fi
+        rm -f "${tune_dir}"/output
+      done
+    done
+    ## compression doesn't depend on the channel count. Keep the winner of the first channel count
+    if [[ -n "${best}" ]]; then
+      compressions=$(cut -d' ' -f3 <<< "${best}")
+    fi
+  done
+  rm -rf "${tune_dir}"
+
+  if [[ -z "${best}" ]]; then
+    main::errhandle_log_warning "--- No Backint test backup succeeded. Keeping the default Backint settings"
+    return 1
+  fi
+
+  ## apply the fastest combination
+  read -r channels chunk compression <<< "${best}"
+  main::errhandle_log_info "--- Using ${channels} channels, ${chunk} MB chunks, compression ${compression} (${best_rate} MB/s). Measurements are in ${results}"
+  sed -i --follow-symlinks -e '/^\\\?#CHUNK_SIZE_MB/d' "${parameters}"
+  echo "#CHUNK_SIZE_MB ${chunk}" >> "${parameters}"
+  if [[ "${compression}" != "current" ]]; then
+    sed -i --follow-symlinks -e '/^\\\?#DISABLE_COMPRESSION/d' "${parameters}"
+    if [[ "${compression}" = "no" ]]; then
+      echo "#DISABLE_COMPRESSION" >> "${parameters}"
+    else
+      echo "\\#DISABLE_COMPRESSION" >> "${parameters}"
+    fi
+  fi
+  hdb::set_parameters global.ini backup parallel_data_backup_backint_channels "${channels}"
+}
+
+
+hdb::config_log_staging() {
+  local backup_bucket=${1}
+  local sid=${VM_METADATA[sap_hana_sid]}
+  local staging=/hanabackup/log/${sid}
+  local parallel=${VM_METADATA[sap_hana_log_upload_parallel]:-4}
+  local uploader=/usr/local/sbin/sap_hana_log_uploader
+
+  if [[ -z "${backup_bucket}" ]]; then
+    main::errhandle_log_warning "--- No backup bucket to upload log backups to. Log backups will remain in ${staging}"
+    return 1
+  fi
+
+  main::errhandle_log_info "--- Staging log backups in ${staging} and uploading them to gs://${backup_bucket}/${sid}/log with ${parallel} parallel uploads"
+  mkdir -p "${staging}"
+  chown root:sapsys "${staging}"
+  chmod g=wrx "${staging}"
+
+  ## log backups are uploaded once HANA has stopped writing them, and only removed locally once the object's CRC32C matches
+  cat > "${uploader}" <<EOF
+#!/bin/bash
+## Uploads SAP HANA log backups staged in ${staging} to gs://${backup_bucket}/${sid}/log
+export STAGING=${staging}
+export TARGET=gs://${backup_bucket}/${sid}/log
+export GSUTIL=${GSUTIL}
+
+upload() {
+  local file=\${1}
+  local object=\${TARGET}/\${file#\${STAGING}/}
+  local local_crc
+  local remote_crc
+
+  if ! \${GSUTIL} -q cp "\${file}" "\${object}"; then
+    logger -t sap_hana_log_uploader "Upload of \${file} failed. Retrying on the next pass"
+    return 1
+  fi
+  local_crc=\$(\${GSUTIL} hash -c "\${file}" | awk '/crc32c/ {print \$NF}')
+  remote_crc=\$(\${GSUTIL} ls -L "\${object}" | awk '/Hash \(crc32c\)/ {print \$NF}')
+  if [[ -z "\${local_crc}" ]] || [[ "\${local_crc}" != "\${remote_crc}" ]]; then
+    logger -t sap_hana_log_uploader "Checksum of \${object} doesn't match \${file}. Retrying on the next pass"
+    return 1
+  fi
+  rm -f "\${file}"
+}
+export -f upload
+
+while true; do
+  find "\${STAGING}" -type f -name 'log_backup_*' -mmin +1 -print0 | xargs -0 -r -n 1 -P ${parallel} bash -c 'upload "\${1}"' _
+  sleep 30
+done
+EOF
+  chmod 0700 "${uploader}"
+
+  cat > /etc/systemd/system/sap-hana-log-uploader.service <<EOF
+[Unit]
+Description=Upload staged SAP HANA log backups to Cloud Storage
+After=network-online.target
+
+[Service]
+ExecStart=${uploader}
+Restart=always
+RestartSec=30
+
+[Install]
+WantedBy=multi-user.target
+EOF
+  systemctl daemon-reload
+  systemctl enable sap-hana-log-uploader.service
+  if ! systemctl start sap-hana-log-uploader.service; then
+    main::errhandle_log_warning "--- Unable to start the log backup uploader. Log backups will remain in ${staging}"
+    return 1
+  fi
+}
+
+
+hdb::publish_lib_version() {
+  ## workers boot with the master and load the deployment libraries it resolved
+  if [ ! "${VM_METADATA[sap_hana_scaleout_nodes]}" = "0" ]; then
+    main::publish_lib_version $(seq -f "${HOSTNAME}w%g" 1 "${VM_METADATA[sap_hana_scaleout_nodes]}")
+  fi
 }
 
 
@@ -549,11 +1367,20 @@ hdb::install_worker_sshkeys() {
     main::errhandle_log_info "Installing SSH keys"
     local worker
     local count=0
+    local workers=()
+
+    ## workers signal once they are up, so keys are only added to existing instances
+    for worker in $(seq 1 "${VM_METADATA[sap_hana_scaleout_nodes]}"); do
+      workers+=("${hana_master_node}w${worker}")
+    done
+    main::barrier_wait booted 600 "${workers[@]}"
+
   	for worker in $(seq 1 "${VM_METADATA[sap_hana_scaleout_nodes]}"); do
       while ! ${GCLOUD} --quiet compute instances add-metadata "${hana_master_node}"w"${worker}" --metadata "ssh-keys=root:$(cat ~/.ssh/id_rsa.pub)"; do
           ## if gcloud returns an error, keep trying.
           main::errhandle_log_info "--- Unable to add keys to ${hana_master_node}w${worker}. Waiting 10 seconds then trying again"
     			sleep 10s
+          count=$((count +1))
           ## if more than 60 failures, give up
           if [ $count -gt 60 ]; then
             main::errhandle_log_error "Unable to add SSH keys to all scale-out worker hosts"
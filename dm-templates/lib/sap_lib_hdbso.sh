@@ -180,18 +180,15 @@ hdbso::install_scaleout_nodes() {
   main::errhandle_log_info "Preparing to install additional SAP HANA nodes"
 
   local worker
-  local count=0
+  local hosts=()
 
   for worker in $(seq 1 "${VM_METADATA[sap_hana_scaleout_nodes]}"); do
-    while [[ $(ssh -o StrictHostKeyChecking=no "${HOSTNAME}"w"${worker}" "echo 1") != [1] ]]; do
-			count=$((count +1))
-      main::errhandle_log_info "--- ${HOSTNAME}w${worker} is not accessible via SSH - sleeping for 10 seconds and trying again"
-      sleep 10
-      if [ ${count} -gt 60 ]; then
-        main::errhandle_log_error "Unable to add additional HANA hosts. Couldn't connect to additional ${HOSTNAME}w${worker} via SSH"
-      fi
-    done
+    hosts+=("${HOSTNAME}w${worker}")
   done
+  main::barrier_wait worker_ready 1200 "${hosts[@]}"
+  if ! hdb::wait_for_ssh "${hosts[@]}"; then
+    main::errhandle_log_error "Unable to add additional HANA hosts. Couldn't connect to all additional hosts via SSH"
+  fi
 
   ## get passwords from install file
   local hana_xml="<?xml version=\"1.0\" encoding=\"UTF-8\"?><Passwords>"
@@ -201,22 +198,17 @@ hdbso::install_scaleout_nodes() {
 
   cd /hana/shared/"${VM_METADATA[sap_hana_sid]}"/hdblcm || main::errhandle_log_error "Unable to access HANA Lifecycle Manager. Additional HANA nodes will not be installed"
 
-  ## Install Worker Nodes
-  if [[ ! "${VM_METADATA[sap_hana_worker_nodes]}" = "0" ]]; then
-    main::errhandle_log_info "Installing ${VM_METADATA[sap_hana_worker_nodes]} worker nodes"
-    ## ssh into each worker node and start SAP HANA
-    for worker in $(seq 1 "${VM_METADATA[sap_hana_worker_nodes]}"); do
-      main::errhandle_log_info "--- ${HOSTNAME}w${worker}"
-      echo "${hana_xml}" | ./hdblcm --action=add_hosts --addhosts="${HOSTNAME}"w"${worker}" --root_user=root --listen_interface=global --read_password_from_stdin=xml -b
-    done
-  fi
-
-  if [[ ! ${VM_METADATA[sap_hana_standby_nodes]} = "0" ]]; then
-    main::errhandle_log_info "Installing ${VM_METADATA[sap_hana_standby_nodes]} standby nodes"
-    for worker in $(seq $((VM_METADATA[sap_hana_worker_nodes]+1)) "${VM_METADATA[sap_hana_scaleout_nodes]}"); do
-      main::errhandle_log_info "--- ${HOSTNAME}w${worker}"
-      echo "${hana_xml}" | ./hdblcm --action=add_hosts --addhosts="${HOSTNAME}"w"${worker}":role=standby --root_user=root --listen_interface=global --read_password_from_stdin=xml -b
-    done
+  ## Install worker and standby nodes with a single hdblcm call
+  hosts=()
+  for worker in $(seq 1 "${VM_METADATA[sap_hana_worker_nodes]}"); do
+    hosts+=("${HOSTNAME}w${worker}")
+  done
+  for worker in $(seq $((VM_METADATA[sap_hana_worker_nodes]+1)) "${VM_METADATA[sap_hana_scaleout_nodes]}"); do
+    hosts+=("${HOSTNAME}w${worker}:role=standby")
+  done
+  main::errhandle_log_info "Installing ${VM_METADATA[sap_hana_worker_nodes]} worker nodes and ${VM_METADATA[sap_hana_standby_nodes]} standby nodes"
+  if ! hdb::add_hosts "${hana_xml}" "${hosts[@]}"; then
+    main::errhandle_log_error "Unable to add all additional HANA hosts. The server deployment is complete but SAP HANA is not fully deployed. Manual SAP HANA installation will be required."
   fi
 
   if [[ ! ${VM_METADATA[sap_hana_standby_nodes]} = "0" ]]; then
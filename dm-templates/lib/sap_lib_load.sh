@@ -0,0 +1,125 @@
+#!/bin/bash
+# ------------------------------------------------------------------------
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Description:  Google Cloud Platform - SAP Deployment Library Loader
+# Build Date:   Sat Oct 19 12:00:00 GMT 2019
+# ------------------------------------------------------------------------
+
+main::load_libs() {
+	local lib
+	local version
+	local checksum
+	local latest_version
+	local latest_checksum
+	local master
+	local count=0
+	local dir
+	local bundle_dir
+	local pinned
+	local cache=/root/.deploy/lib
+	local attributes=http://169.254.169.254/computeMetadata/v1/instance/attributes
+
+	## version and checksum pinned by the template, else the version cached by a previous boot, else the latest
+	## published version. The checksum comes from the same place as the version, never from next to the bundle
+	version=$(curl --fail -sH'Metadata-Flavor: Google' "${attributes}"/sap_lib_version)
+	checksum=$(curl --fail -sH'Metadata-Flavor: Google' "${attributes}"/sap_lib_sha256)
+
+	## scale-out workers load the version their master resolved, which it writes to their metadata
+	master=$(curl --fail -sH'Metadata-Flavor: Google' "${attributes}"/sap_lib_master)
+	if [[ -z "${version}" ]] && [[ -n "${master}" ]] && [[ ! -f "${cache}/VERSION" ]]; then
+		echo "INFO - Waiting for ${master} to pass its deployment library version"
+		while [[ -z "${version}" ]] && [[ ${count} -lt 60 ]]; do
+			sleep 10
+			version=$(curl --fail -sH'Metadata-Flavor: Google' "${attributes}"/sap_lib_version)
+			count=$((count +1))
+		done
+		checksum=$(curl --fail -sH'Metadata-Flavor: Google' "${attributes}"/sap_lib_sha256)
+		if [[ -z "${version}" ]]; then
+			echo "WARNING - ${master} didn't pass its deployment library version. Using the latest published version"
+		fi
+	fi
+
+	if [[ -z "${version}" ]] && [[ -f "${cache}/VERSION" ]]; then
+		read -r version checksum < "${cache}/VERSION"
+	fi
+	## a pinned or previously loaded version must be verified. Loading the current individual libraries instead
+	## would silently run different code
+	if [[ -n "${version}" ]] && [[ ! "${version}" = "none" ]]; then
+		pinned=yes
+	fi
+	if [[ -z "${version}" ]] || [[ -z "${checksum}" ]]; then
+		read -r latest_version latest_checksum <<< "$(curl --fail -s "${DEPLOY_URL}"/lib/bundle/LATEST)"
+		version=${version:-${latest_version}}
+		if [[ "${version}" = "${latest_version}" ]]; then
+			checksum=${checksum:-${latest_checksum}}
+		fi
+	fi
+	if [[ -n "${version}" ]] && [[ ! "${version}" = "none" ]] && [[ -z "${checksum}" ]]; then
+		if [[ -n "${pinned}" ]]; then
+			echo "ERROR - No checksum is known for deployment library bundle ${version}. Set deployment_lib_sha256 in the template"
+			exit 1
+		fi
+		echo "WARNING - No checksum is published for deployment library bundle ${version}. Loading individual libraries"
+		version=
+	fi
+
+	## use a copy shared by the scale-out master or cached on local disk if it matches the checksum
+	if [[ -n "${version}" ]] && [[ ! "${version}" = "none" ]]; then
+		for dir in /hana/shared/.deploy/lib "${cache}"; do
+			if [[ -f "${dir}/sap_lib-${version}.tar.gz" ]] && echo "${checksum}  ${dir}/sap_lib-${version}.tar.gz" | sha256sum --status -c - 2>/dev/null; then
+				bundle_dir=${dir}
+				break
+			fi
+		done
+
+		if [[ -z "${bundle_dir}" ]]; then
+			echo "INFO - Downloading deployment library bundle ${version}"
+			mkdir -p "${cache}"
+			if curl --fail -s "${DEPLOY_URL}/lib/bundle/sap_lib-${version}.tar.gz" -o "${cache}/sap_lib-${version}.tar.gz" \
+				&& echo "${checksum}  ${cache}/sap_lib-${version}.tar.gz" | sha256sum --status -c - 2>/dev/null; then
+				bundle_dir=${cache}
+			else
+				rm -f "${cache}/sap_lib-${version}.tar.gz"
+				if [[ -n "${pinned}" ]]; then
+					echo "ERROR - Deployment library bundle ${version} is unavailable or failed its checksum"
+					exit 1
+				fi
+				echo "WARNING - Deployment library bundle ${version} is unavailable or failed its checksum. Loading individual libraries"
+			fi
+		fi
+	fi
+
+	if [[ -n "${bundle_dir}" ]]; then
+		echo "INFO - Loading deployment library bundle ${version} from ${bundle_dir}"
+		mkdir -p "${cache}/${version}"
+		tar -xzf "${bundle_dir}/sap_lib-${version}.tar.gz" -C "${cache}/${version}"
+		echo "${version} ${checksum}" > "${cache}/VERSION"
+		SAP_LIB_VERSION=${version}
+		SAP_LIB_SHA256=${checksum}
+		## the bundle carries the loader it was built with. Keep the local copy in step for the next boot
+		if [[ -f "${cache}/${version}/sap_lib_load.sh" ]] && ! cmp -s "${cache}/${version}/sap_lib_load.sh" "${cache}/sap_lib_load.sh"; then
+			echo "INFO - Updating ${cache}/sap_lib_load.sh from bundle ${version}"
+			cp "${cache}/${version}/sap_lib_load.sh" "${cache}/sap_lib_load.sh.new" && mv "${cache}/sap_lib_load.sh.new" "${cache}/sap_lib_load.sh"
+		fi
+		for lib in "${@}"; do
+			source "${cache}/${version}/sap_lib_${lib}.sh"
+		done
+	else
+		SAP_LIB_VERSION=none
+		for lib in "${@}"; do
+			source /dev/stdin <<< "$(curl -s "${DEPLOY_URL}"/lib/sap_lib_"${lib}".sh)"
+		done
+	fi
+}
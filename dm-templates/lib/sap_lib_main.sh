@@ -22,6 +22,11 @@ set +e
 main::set_boot_parameters() {
 	main::errhandle_log_info 'Checking boot paramaters'
 
+	if main::image_prepared boot_parameters; then
+		main::errhandle_log_info "--- Boot parameters already set in image $(main::image_version)"
+		return 0
+	fi
+
 	## disable selinux
 	if [[ -e /etc/sysconfig/selinux ]]; then
 	  main::errhandle_log_info "--- Disabling SELinux"
@@ -57,25 +62,26 @@ main::errhandle_log_info() {
   local log_entry=${1}
 
 	echo "INFO - ${log_entry}"
-  if [[ -n "${GCLOUD}" ]]; then
-	   ${GCLOUD} --quiet logging write "${HOSTNAME}" "${HOSTNAME} Deployment \"${log_entry}\"" --severity=INFO
-  fi
+	main::log_spool INFO "${log_entry}"
 }
 
 
 main::errhandle_log_warning() {
   local log_entry=${1}
 
-	if [[ -z "${deployment_warnings}" ]]; then
-		deployment_warnings=1
+	## steps running in the background lose their variables when they finish, so they count warnings in a file
+	if [[ "${BASHPID}" = "$$" ]]; then
+		deployment_warnings=$((${deployment_warnings:-0} +1))
 	else
-		deployment_warnings=$((deployment_warnings +1))
+		mkdir -p /root/.deploy
+		{
+			flock -x 9
+			echo "${BASHPID}" >&9
+		} 9>>/root/.deploy/warnings_$$
 	fi
 
 	echo "WARNING - ${log_entry}"
-  if [[ -n "${GCLOUD}" ]]; then
-    ${GCLOUD} --quiet logging write "${HOSTNAME}" "${HOSTNAME} Deployment \"${log_entry}\"" --severity=WARNING
-  fi
+	main::log_spool WARNING "${log_entry}"
 }
 
 
@@ -83,13 +89,125 @@ main::errhandle_log_error() {
   local log_entry=${1}
 
 	echo "ERROR - Deployment Exited - ${log_entry}"
-  if [[ -n "${GCLOUD}" ]]; then
-    ${GCLOUD}	--quiet logging write "${HOSTNAME}" "${HOSTNAME} Deployment \"${log_entry}\"" --severity=ERROR
-  fi
+	main::log_spool ERROR "${log_entry}"
 	main::complete error
 }
 
 
+main::log_spool() {
+	local severity=${1}
+	local log_entry=${2}
+	local spool_dir=/root/.deploy/log_spool
+	local code
+	local char
+	local escaped
+
+	## escape the entry so it can be sent as-is in a JSON request
+	log_entry="${HOSTNAME} Deployment \"${log_entry}\""
+	log_entry=${log_entry//\\/\\\\}
+	log_entry=${log_entry//\"/\\\"}
+	log_entry=${log_entry//$'\n'/\\n}
+	log_entry=${log_entry//$'\r'/\\r}
+	log_entry=${log_entry//$'\t'/\\t}
+	## any other control character, e.g. colour codes in installer output, would make the whole request invalid
+	if [[ "${log_entry}" = *[[:cntrl:]]* ]]; then
+		for code in {1..31}; do
+			printf -v char "\\$(printf %03o "${code}")"
+			printf -v escaped '\\u%04x' "${code}"
+			log_entry=${log_entry//"${char}"/"${escaped}"}
+		done
+	fi
+
+	mkdir -p "${spool_dir}"
+	{
+		flock -x 9
+		printf '{"severity":"%s","timestamp":"%s","textPayload":"%s"}\n' "${severity}" "$(date -u +%FT%T.%NZ)" "${log_entry}" >> "${spool_dir}/entries"
+	} 9>"${spool_dir}/lock"
+
+	## the forwarder can only be started (and later flushed) from the main deployment shell
+	if [[ -z "${LOG_FORWARDER_PID}" ]] && [[ "${BASHPID}" = "$$" ]]; then
+		rm -f "${spool_dir}/stop"
+		main::log_forwarder "${spool_dir}" </dev/null >/dev/null 2>&1 &
+		LOG_FORWARDER_PID=$!
+	fi
+}
+
+
+main::log_forwarder() {
+	local spool_dir=${1}
+	local project
+	local token
+	local batch
+	local attempts=0
+	local stopping
+	local sent
+	local i
+	local -a entries
+
+	project=$(main::get_metadata http://169.254.169.254/computeMetadata/v1/project/project-id)
+
+	## forward spooled entries to Cloud Logging in batches until asked to stop and the spool is empty
+	while true; do
+		[[ -f "${spool_dir}/stop" ]] && stopping=yes
+
+		if [[ ! -s "${spool_dir}/batch" ]] && [[ -s "${spool_dir}/entries" ]]; then
+			{
+				flock -x 9
+				mv "${spool_dir}/entries" "${spool_dir}/batch"
+			} 9>"${spool_dir}/lock"
+		fi
+
+		if [[ -s "${spool_dir}/batch" ]]; then
+			token=$(main::get_metadata http://169.254.169.254/computeMetadata/v1/instance/service-accounts/default/token | grep -o '"access_token" *: *"[^"]*"' | cut -d'"' -f4)
+			mapfile -t entries < "${spool_dir}/batch"
+			sent=yes
+			for (( i=0; i<${#entries[@]}; i+=500 )); do
+				batch=$(IFS=,; echo "${entries[*]:i:500}")
+				if ! curl --fail -s -o /dev/null -X POST \
+						-H "Authorization: Bearer ${token}" -H "Content-Type: application/json" \
+						-d "{\"logName\":\"projects/${project}/logs/${HOSTNAME}\",\"resource\":{\"type\":\"global\"},\"entries\":[${batch}]}" \
+						https://logging.googleapis.com/v2/entries:write; then
+					## keep only the entries not sent yet, so a retry doesn't duplicate the chunks that were
+					printf '%s\n' "${entries[@]:i}" > "${spool_dir}/batch"
+					sent=
+					break
+				fi
+			done
+			attempts=$((attempts + 1))
+			## give up on a batch after repeated failures so a missing logging scope doesn't block the deployment
+			if [[ -n "${sent}" ]] || [[ ${attempts} -ge 5 ]]; then
+				rm -f "${spool_dir}/batch"
+				attempts=0
+			fi
+		elif [[ -n "${stopping}" ]] && [[ ! -s "${spool_dir}/entries" ]]; then
+			rm -f "${spool_dir}/stop"
+			return 0
+		fi
+
+		[[ -z "${stopping}" ]] && sleep 2
+		[[ -n "${stopping}" ]] && [[ -s "${spool_dir}/batch" ]] && sleep 1
+	done
+}
+
+
+main::log_flush() {
+	local count=0
+
+	if [[ -z "${LOG_FORWARDER_PID}" ]]; then
+		return 0
+	fi
+
+	## ask the forwarder to send the remaining entries and wait up to a minute for it to finish
+	touch /root/.deploy/log_spool/stop
+	while kill -0 "${LOG_FORWARDER_PID}" 2>/dev/null && [[ ${count} -lt 60 ]]; do
+		sleep 1
+		count=$((count +1))
+	done
+	kill "${LOG_FORWARDER_PID}" 2>/dev/null
+	LOG_FORWARDER_PID=
+}
+
+
 main::get_os_version() {
 	if grep SLES /etc/os-release; then
 		readonly LINUX_DISTRO="SLES"
@@ -123,27 +241,38 @@ main::install_ssh_key(){
 
 
 main::install_packages() {
+	local phase_start=${SECONDS}
+	local package_cache
+	local cache_dir=/var/cache/sap-packages
+	local -a cache_rpms
+
 	main::errhandle_log_info 'Installing required operating system packages'
 
+	if main::image_prepared packages; then
+		main::errhandle_log_info "--- Packages already installed in image $(main::image_version)"
+		return 0
+	fi
+
   ## SuSE work around to avoid a startup race condition
   if [[ ${LINUX_DISTRO} = "SLES" ]]; then
     local count=0
 
     ## check if SuSE repos are registered
 		while [[ $(find /etc/zypp/repos.d/ -maxdepth 1 | wc -l) -lt 2 ]]; do
-			main::errhandle_log_info "--- SuSE repositories are not registered. Waiting 10 seconds before trying again"
-			sleep 60s
+			if [[ $((count % 30)) -eq 0 ]]; then
+				main::errhandle_log_info "--- SuSE repositories are not registered. Waiting before trying again"
+			fi
+			sleep 2s
 			count=$((count +1))
-			if [ ${count} -gt 30 ]; then
+			if [ ${count} -gt 900 ]; then
 				main::errhandle_log_error "SuSE repositories didn't register within an acceptable time. If you are using BYOS, ensure you login to the system and apply the SuSE license within 30 minutes after deployment."
 			fi
 		done
-		sleep 10s
 
     ## check if zypper is still running
-  	while pgrep zypper; do
-  		errhandle_log_info "--- zypper is still running. Waiting 10 seconds before continuing"
-  		sleep 10s
+  	while pgrep zypper >/dev/null; do
+  		main::errhandle_log_info "--- zypper is still running. Waiting 2 seconds before continuing"
+  		sleep 2s
   	done
 
 		## Temporary fix fro SLES15 incompatible boto version
@@ -155,27 +284,56 @@ EOF
 			rm -f /etc/boto.cfg
 		fi
 	fi
+	main::errhandle_log_info "--- Package manager ready after $((SECONDS - phase_start)) seconds"
 
   ## packages to install
 	## TODO - Add above API packages to RHEL
-	local sles_packages="libopenssl0_9_8 libopenssl1_0_0 joe tuned krb5-32bit unrar SAPHanaSR SAPHanaSR-doc pacemaker numactl csh python-pip python-pyasn1-modules ndctl" #python-oauth2client python-oauth2client-gce python-httplib2 python-requests python-google-api-python-client"
-	local rhel_packages="unar.x86_64 tuned-profiles-sap-hana tuned-profiles-sap-hana-2.7.1-3.el7_3.3 joe resource-agents-sap-hana.x86_64 compat-sap-c++-6 numactl-libs.x86_64 libtool-ltdl.x86_64 nfs-utils.x86_64 pacemaker pcs lvm2.x86_64 compat-sap-c++-5.x86_64 csh autofs ndctl"
+	local sles_packages="libopenssl0_9_8 libopenssl1_0_0 joe tuned krb5-32bit unrar SAPHanaSR SAPHanaSR-doc pacemaker numactl csh python-pip python-pyasn1-modules ndctl socat sapconf saptune" #python-oauth2client python-oauth2client-gce python-httplib2 python-requests python-google-api-python-client"
+	local rhel_packages="unar.x86_64 tuned-profiles-sap-hana joe resource-agents-sap-hana.x86_64 compat-sap-c++-6 numactl-libs.x86_64 libtool-ltdl.x86_64 nfs-utils.x86_64 pacemaker pcs lvm2.x86_64 compat-sap-c++-5.x86_64 csh autofs ndctl socat"
+
+	## use packages baked into the image or staged in GCS instead of downloading them from the distribution repositories
+	phase_start=${SECONDS}
+	package_cache=$(main::get_metadata sap_package_cache)
+	if [[ "${package_cache:0:5}" = "gs://" ]]; then
+		main::errhandle_log_info "--- Fetching packages from ${package_cache}"
+		mkdir -p "${cache_dir}"
+		${GSUTIL} -q -m cp "${package_cache%/}/*.rpm" "${cache_dir}"/
+	fi
+	if [[ -d "${cache_dir}" ]]; then
+		shopt -s nullglob
+		cache_rpms=("${cache_dir}"/*.rpm)
+		shopt -u nullglob
+		main::errhandle_log_info "--- Using ${#cache_rpms[@]} packages from ${cache_dir} after $((SECONDS - phase_start)) seconds"
+	fi
 
-	## install packages
+	## install all packages in a single transaction, falling back to one package at a time if it can't be resolved
+	phase_start=${SECONDS}
 	if [[ ${LINUX_DISTRO} = "SLES" ]]; then
-		for package in ${sles_packages}; do
-		    zypper in -y "${package}"
-		done
-		zypper in -y sapconf saptune
+		export ZYPP_PCK_PRELOAD=1
+		if ! zypper --non-interactive --ignore-unknown install --download-in-advance ${sles_packages} "${cache_rpms[@]}"; then
+			main::errhandle_log_warning "--- Unable to install packages in a single transaction. Installing them one at a time"
+			for package in ${sles_packages}; do
+				zypper in -y "${package}"
+			done
+		fi
 	elif [[ ${LINUX_DISTRO} = "RHEL" ]]; then
-		for package in $rhel_packages; do
-		    yum -y install "${package}"
-		done
+		local yum_options="--setopt=skip_missing_names_on_install=True"
+		if command -v dnf >/dev/null; then
+			yum_options="${yum_options} --setopt=max_parallel_downloads=10"
+		fi
+		if ! yum -y ${yum_options} install ${rhel_packages} "${cache_rpms[@]}"; then
+			main::errhandle_log_warning "--- Unable to install packages in a single transaction. Installing them one at a time"
+			for package in $rhel_packages; do
+				yum -y install "${package}"
+			done
+		fi
 	fi
-	
+	main::errhandle_log_info "--- Operating system packages installed in $((SECONDS - phase_start)) seconds"
+
 	main::errhandle_log_info "Installing python Google Cloud API client"
-	pip install --upgrade google-api-python-client
-	pip install oauth2client --upgrade
+	phase_start=${SECONDS}
+	pip install --upgrade google-api-python-client oauth2client
+	main::errhandle_log_info "--- Python packages installed in $((SECONDS - phase_start)) seconds"
 }
 
 
@@ -290,18 +448,59 @@ main::format_mount() {
 main::get_settings() {
 	main::errhandle_log_info "Fetching GCE Instance Settings"
 
+	## fetch all instance & project metadata in a single request and flatten it into key/value pairs
+	local key
+	local value
+	local python
+	declare -A settings
+	declare -g -A VM_METADATA
+
+	python=$(command -v python3 || command -v python || echo /usr/libexec/platform-python)
+
+	while IFS= read -r -d '' key && IFS= read -r -d '' value; do
+		settings[${key}]="${value}"
+	done < <(curl --fail -sH'Metadata-Flavor: Google' "http://169.254.169.254/computeMetadata/v1/?recursive=true&alt=json" | "${python}" -c '
+import json, sys
+
+def write(text):
+  if not isinstance(text, str):
+    text = text.encode("utf-8") if hasattr(text, "encode") else str(text)
+  sys.stdout.write(text + "\0")
+
+metadata = json.load(sys.stdin)
+instance = metadata["instance"]
+settings = {
+  "zone": instance["zone"],
+  "machine-type": instance["machineType"],
+  "cpu-platform": instance["cpuPlatform"],
+  "network": instance["networkInterfaces"][0]["network"],
+  "ip": instance["networkInterfaces"][0]["ip"],
+  "project-id": metadata["project"]["projectId"],
+}
+for key, value in instance.get("attributes", {}).items():
+  if "ssh-keys" not in key:
+    settings["attributes/" + key] = value
+for key, value in settings.items():
+  write(key)
+  write(value)
+')
+
+	if [[ -z "${settings[zone]}" ]]; then
+		main::errhandle_log_error "Unable to read instance metadata from the metadata server"
+	fi
+
 	## set current zone as the default zone
-	readonly CLOUDSDK_COMPUTE_ZONE=$(main::get_metadata "http://169.254.169.254/computeMetadata/v1/instance/zone" | cut -d'/' -f4)
+	readonly CLOUDSDK_COMPUTE_ZONE=$(cut -d'/' -f4 <<< "${settings[zone]}")
 	export CLOUDSDK_COMPUTE_ZONE
 	main::errhandle_log_info "--- Instance determined to be running in ${CLOUDSDK_COMPUTE_ZONE}. Setting this as the default zone"
 
 	readonly VM_REGION=${CLOUDSDK_COMPUTE_ZONE::-2}
 
 	## get instance type & details
-	readonly VM_INSTTYPE=$(main::get_metadata http://169.254.169.254/computeMetadata/v1/instance/machine-type | cut -d'/' -f4)
+	readonly VM_INSTTYPE=$(cut -d'/' -f4 <<< "${settings[machine-type]}")
 	main::errhandle_log_info "--- Instance type determined to be ${VM_INSTTYPE}"
 
-	readonly VM_CPUPLAT=$(main::get_metadata "http://169.254.169.254/computeMetadata/v1/instance/cpu-platform")
+	readonly VM_CPUPLAT=${settings[cpu-platform]}
 	main::errhandle_log_info "--- Instance is determined to be part on CPU Platform ${VM_CPUPLAT}"
 
 	readonly VM_CPUCOUNT=$(grep -c processor /proc/cpuinfo)
@@ -311,28 +510,38 @@ main::get_settings() {
 	main::errhandle_log_info "--- Instance determined to have ${VM_MEMSIZE}GB of memory"
 
 	## get network settings
-	readonly VM_NETWORK=$(main::get_metadata http://169.254.169.254/computeMetadata/v1/instance/network-interfaces/0/network | cut -d'/' -f4)
+	readonly VM_NETWORK=$(cut -d'/' -f4 <<< "${settings[network]}")
 	main::errhandle_log_info "--- Instance is determined to be part of network ${VM_NETWORK}"
 
-	readonly VM_NETWORK_FULL=$(gcloud compute instances describe "${HOSTNAME}" | grep "subnetwork:" | head -1 | grep -o 'projects.*')
-
-	readonly VM_SUBNET=$(grep -o 'subnetworks.*' <<< "${VM_NETWORK_FULL}" | cut -f2- -d"/")
+	## subnetwork is passed by the template as <subnetwork> or <host project>/<subnetwork> for shared VPC
+	if [[ -n "${settings[attributes/sap_subnetwork]}" ]]; then
+		readonly VM_SUBNET=${settings[attributes/sap_subnetwork]##*/}
+		if [[ "${settings[attributes/sap_subnetwork]}" = */* ]]; then
+			readonly VM_NETWORK_PROJECT=${settings[attributes/sap_subnetwork]%%/*}
+		else
+			readonly VM_NETWORK_PROJECT=${settings[project-id]}
+		fi
+	else
+		## templates without sap_subnetwork metadata
+		readonly VM_NETWORK_FULL=$(gcloud compute instances describe "${HOSTNAME}" | grep "subnetwork:" | head -1 | grep -o 'projects.*')
+		readonly VM_SUBNET=$(grep -o 'subnetworks.*' <<< "${VM_NETWORK_FULL}" | cut -f2- -d"/")
+		readonly VM_NETWORK_PROJECT=$(cut -d'/' -f2 <<< "${VM_NETWORK_FULL}")
+	fi
 	main::errhandle_log_info "--- Instance is determined to be part of subnetwork ${VM_SUBNET}"
-
-	readonly VM_NETWORK_PROJECT=$(cut -d'/' -f2 <<< "${VM_NETWORK_FULL}")
 	main::errhandle_log_info "--- Networking is hosted in project ${VM_NETWORK_PROJECT}"
 
-	readonly VM_IP=$(main::get_metadata http://169.254.169.254/computeMetadata/v1/instance/network-interfaces/0/ip)
+	readonly VM_IP=${settings[ip]}
 	main::errhandle_log_info "--- Instance IP is determined to be ${VM_IP}"
 
-	# fetch all custom metadata associated with the instance
+	# custom metadata associated with the instance
 	main::errhandle_log_info "Fetching GCE Instance Metadata"
-	local value
-	local key
-	declare -g -A VM_METADATA
 
-	for key in $(curl --fail -sH'Metadata-Flavor: Google' http://169.254.169.254/computeMetadata/v1/instance/attributes/ | grep -v ssh-keys); do
-		value=$(main::get_metadata "${key}")
+	for key in "${!settings[@]}"; do
+		if [[ ! "${key}" = "attributes/"* ]]; then
+			continue
+		fi
+		value=${settings[${key}]}
+		key=${key#attributes/}
 		VM_METADATA[$key]="${value}"
 
 		if [[ "${key}" = *"password"* ]]; then
@@ -362,6 +571,106 @@ main::remove_metadata() {
 }
 
 
+main::barrier_arrive() {
+  local zone
+  if [[ "${1}" = "-z" ]]; then
+    zone=${2}
+    shift 2
+  fi
+  local barrier=${1}
+  shift
+  local host
+  local pids=()
+  local pid
+  local failed=0
+
+  ## record the arrival in the metadata of each waiting host. This wakes up main::barrier_wait there
+  for host in "${@}"; do
+    (
+      local count=0
+      while ! ${GCLOUD} --quiet compute instances add-metadata "${host}" ${zone:+--zone "${zone}"} --metadata "sap_barrier_${barrier}_${HOSTNAME}=$(date +%s)" >/dev/null 2>&1; do
+        ## concurrent metadata updates of the same instance fail. Back off and try again
+        count=$((count +1))
+        if [[ ${count} -gt 10 ]]; then
+          main::errhandle_log_warning "--- Unable to signal ${barrier} to ${host}"
+          exit 1
+        fi
+        sleep $((RANDOM % 5 + 1))
+      done
+    ) &
+    pids+=($!)
+  done
+
+  for pid in "${pids[@]}"; do
+    if ! wait "${pid}"; then
+      failed=1
+    fi
+  done
+  return ${failed}
+}
+
+
+main::barrier_wait() {
+  local barrier=${1}
+  local timeout=${2}
+  shift 2
+  local peer
+  local missing=("${@}")
+  local remaining
+  local keys=("${@/#/sap_barrier_${barrier}_}")
+  local attributes
+  local etag
+  local query=""
+  local start=${SECONDS}
+
+  main::errhandle_log_info "Waiting for ${*} to reach ${barrier}"
+  mkdir -p /root/.deploy
+
+  while true; do
+    ## the first request returns the current metadata, later ones block until it changes
+    attributes=$(curl -s --fail -D /root/.deploy/barrier.headers -H 'Metadata-Flavor: Google' "http://169.254.169.254/computeMetadata/v1/instance/attributes/?recursive=true${query}")
+    etag=$(grep -i '^etag:' /root/.deploy/barrier.headers 2>/dev/null | awk '{ print $2 }' | tr -d '\r')
+
+    remaining=()
+    for peer in "${missing[@]}"; do
+      if ! grep -q "\"sap_barrier_${barrier}_${peer}\"" <<< "${attributes}"; then
+        remaining+=("${peer}")
+      fi
+    done
+    missing=("${remaining[@]}")
+
+    if [[ ${#missing[@]} -eq 0 ]]; then
+      main::errhandle_log_info "--- ${barrier} reached after $((SECONDS - start)) seconds"
+      ## stale keys would release the barrier at once on a rerun, so keep trying while other hosts update this instance's metadata
+      (
+        local count=0
+        while ! ${GCLOUD} --quiet compute instances remove-metadata "${HOSTNAME}" --keys "$(IFS=,; echo "${keys[*]}")" >/dev/null 2>&1; do
+          count=$((count +1))
+          if [[ ${count} -gt 10 ]]; then
+            main::errhandle_log_warning "--- Unable to remove the ${barrier} keys from the metadata of ${HOSTNAME}. Remove $(IFS=,; echo "${keys[*]}") before rerunning the deployment"
+            exit 1
+          fi
+          sleep $((RANDOM % 5 + 1))
+        done
+      ) &
+      return 0
+    fi
+
+    if [[ $((SECONDS - start)) -ge ${timeout} ]]; then
+      main::errhandle_log_warning "--- ${missing[*]} did not reach ${barrier} within ${timeout} seconds"
+      return 1
+    fi
+
+    if [[ -n "${etag}" ]]; then
+      query="&wait_for_change=true&last_etag=${etag}&timeout_sec=$(( timeout - (SECONDS - start) < 60 ? timeout - (SECONDS - start) : 60 ))"
+    else
+      ## metadata server unavailable
+      sleep 5
+    fi
+  done
+}
+
+
 main::install_gsdk() {
 	local install_location=${1}
 
@@ -387,6 +696,373 @@ main::install_gsdk() {
 }
 
 
+main::checkpoint() {
+	local step
+	local checkpoint_dir=/root/.deploy/checkpoints
+	local step_start=${SECONDS}
+	local duration
+	local rc
+
+	## name the checkpoint after the function and its arguments, e.g. main__install_packages
+	step=$(echo "${*}" | sed 's/[^A-Za-z0-9_.-]/_/g')
+
+	## skip steps completed by a previous run of the startup script, e.g. before a reboot or a failure
+	if [[ -f "${checkpoint_dir}/${step}" ]]; then
+		duration=$(cat "${checkpoint_dir}/${step}")
+		main::errhandle_log_info "Skipping ${*} - completed in a previous run in ${duration} seconds"
+		echo "${duration}" >> "${checkpoint_dir}/.skipped"
+		return 0
+	fi
+
+	## only mark the step as completed when it returned success. Steps that only warn and return non-zero are
+	## retried on the next run
+	"${@}"
+	rc=$?
+	if [[ ${rc} -eq 0 ]]; then
+		mkdir -p "${checkpoint_dir}"
+		echo $((SECONDS - step_start)) > "${checkpoint_dir}/${step}"
+	fi
+	return ${rc}
+}
+
+
+main::add_step() {
+	## usage: main::add_step [-f] <name> "<inputs>" "<outputs>" <command> [args]
+	## -f runs the step in the deployment shell so variables it sets are seen by later steps. Keep these steps short,
+	## as no further background steps are started while one is running
+	local foreground
+	if [[ "${1}" = "-f" ]]; then
+		foreground=yes
+		shift
+	fi
+	local step=${1}
+	local inputs=${2}
+	local outputs=${3}
+	shift 3
+	local input
+	local earlier
+	local deps
+
+	declare -g -A STEP_COMMAND STEP_DEPS STEP_OUTPUTS STEP_FOREGROUND
+	declare -g -a STEP_ORDER
+
+	## a step depends on every earlier step producing one of its inputs. Inputs nothing produces are already available
+	for input in ${inputs}; do
+		for earlier in "${STEP_ORDER[@]}"; do
+			if [[ " ${STEP_OUTPUTS[${earlier}]} " = *" ${input} "* ]] && [[ ! " ${deps} " = *" ${earlier} "* ]]; then
+				deps="${deps} ${earlier}"
+			fi
+		done
+	done
+
+	STEP_ORDER+=("${step}")
+	STEP_DEPS[${step}]=${deps}
+	STEP_OUTPUTS[${step}]=${outputs}
+	STEP_FOREGROUND[${step}]=${foreground}
+	STEP_COMMAND[${step}]=$(printf '%q ' "${@}")
+}
+
+
+main::run_steps() {
+	local max_parallel=${1:-4}
+	local step
+	local pid
+	local rc
+	local started
+	local failed
+	local remaining=${#STEP_ORDER[@]}
+	local run_start=${SECONDS}
+	declare -A step_state step_start step_end
+	declare -g -A STEP_PIDS
+
+	main::errhandle_log_info "Running ${remaining} deployment steps with up to ${max_parallel} in parallel"
+
+	while [[ ${remaining} -gt 0 ]]; do
+		## collect finished background steps
+		for pid in "${!STEP_PIDS[@]}"; do
+			if ! kill -0 "${pid}" 2>/dev/null; then
+				wait "${pid}"
+				rc=$?
+				step=${STEP_PIDS[${pid}]}
+				unset "STEP_PIDS[${pid}]"
+				step_end[${step}]=${SECONDS}
+				step_state[${step}]=done
+				remaining=$((remaining -1))
+				main::errhandle_log_info "--- Finished step ${step} in $((step_end[${step}] - step_start[${step}])) seconds"
+				## 3 is returned by main::complete when a step ends the deployment early without an error
+				if [[ ${rc} -eq 3 ]]; then
+					failed=complete
+				elif [[ ${rc} -ne 0 ]]; then
+					failed=${step}
+				fi
+			fi
+		done
+
+		if [[ -n "${failed}" ]]; then
+			## let steps already running finish rather than interrupt disk or package operations
+			if [[ ${#STEP_PIDS[@]} -gt 0 ]]; then
+				main::errhandle_log_info "--- Waiting for running steps to finish"
+				wait "${!STEP_PIDS[@]}"
+				STEP_PIDS=()
+			fi
+			if [[ "${failed}" = "complete" ]]; then
+				main::complete
+			fi
+			main::errhandle_log_error "Deployment step ${failed} failed"
+		fi
+
+		## start background steps whose dependencies have completed
+		started=
+		for step in "${STEP_ORDER[@]}"; do
+			if [[ ${#STEP_PIDS[@]} -ge ${max_parallel} ]]; then
+				break
+			fi
+			if [[ -z "${STEP_FOREGROUND[${step}]}" ]] && main::step_ready "${step}"; then
+				main::errhandle_log_info "--- Starting step ${step}"
+				step_state[${step}]=running
+				step_start[${step}]=${SECONDS}
+				{ eval "${STEP_COMMAND[${step}]}"; exit 0; } &
+				STEP_PIDS[$!]=${step}
+				started=yes
+			fi
+		done
+
+		## then run one step that sets shell state for later steps in this shell, while background steps continue
+		for step in "${STEP_ORDER[@]}"; do
+			if [[ -n "${STEP_FOREGROUND[${step}]}" ]] && main::step_ready "${step}"; then
+				main::errhandle_log_info "--- Starting step ${step}"
+				step_state[${step}]=running
+				step_start[${step}]=${SECONDS}
+				eval "${STEP_COMMAND[${step}]}"
+				step_end[${step}]=${SECONDS}
+				step_state[${step}]=done
+				remaining=$((remaining -1))
+				main::errhandle_log_info "--- Finished step ${step} in $((step_end[${step}] - step_start[${step}])) seconds"
+				started=yes
+				break
+			fi
+		done
+
+		if [[ -z "${started}" ]] && [[ ${remaining} -gt 0 ]]; then
+			sleep 1
+		fi
+	done
+
+	main::report_critical_path "$((SECONDS - run_start))"
+	STEP_ORDER=()
+}
+
+
+main::step_ready() {
+	local step=${1}
+	local dep
+
+	## only called from main::run_steps, whose step_state is visible here
+	if [[ -n "${step_state[${step}]}" ]]; then
+		return 1
+	fi
+	for dep in ${STEP_DEPS[${step}]}; do
+		if [[ ! "${step_state[${dep}]}" = "done" ]]; then
+			return 1
+		fi
+	done
+}
+
+
+main::report_critical_path() {
+	local wall_time=${1}
+	local step
+	local dep
+	local duration
+	local total=0
+	local last
+	local path
+	declare -A path_time path_prev
+
+	## the critical path is the chain of dependent steps with the longest combined duration
+	for step in "${STEP_ORDER[@]}"; do
+		duration=$((step_end[${step}] - step_start[${step}]))
+		total=$((total + duration))
+		path_time[${step}]=${duration}
+		for dep in ${STEP_DEPS[${step}]}; do
+			if [[ $((path_time[${dep}] + duration)) -gt ${path_time[${step}]} ]]; then
+				path_time[${step}]=$((path_time[${dep}] + duration))
+				path_prev[${step}]=${dep}
+			fi
+		done
+		if [[ -z "${last}" ]] || [[ ${path_time[${step}]} -gt ${path_time[${last}]} ]]; then
+			last=${step}
+		fi
+	done
+
+	step=${last}
+	while [[ -n "${step}" ]]; do
+		path="${step} ($((step_end[${step}] - step_start[${step}]))s)${path:+ -> }${path}"
+		step=${path_prev[${step}]}
+	done
+
+	main::errhandle_log_info "Deployment steps finished in ${wall_time} seconds (${total} seconds if run in sequence)"
+	main::errhandle_log_info "--- Critical path (${path_time[${last}]} seconds): ${path}"
+}
+
+
+main::profile_functions() {
+	local fn
+
+	if [[ -n "${PROFILE_EVENTS}" ]]; then
+		return 0
+	fi
+	PROFILE_EVENTS=/root/.deploy/${HOSTNAME}_deployment_trace.events
+	PROFILE_DEPTH=0
+	declare -g -a PROFILE_CHILDREN=(0)
+	mkdir -p /root/.deploy
+	echo "{\"name\":\"process_name\",\"ph\":\"M\",\"pid\":1,\"args\":{\"name\":\"${HOSTNAME}\"}}" > "${PROFILE_EVENTS}"
+
+	## wrap every library function so its duration is recorded. Logging, step bookkeeping and helpers called in polling loops
+	## are left out, as each wrapped call forks date twice
+	for fn in $(declare -F | awk '{ print $3 }' | grep -E '^[a-z0-9]+::'); do
+		case ${fn} in
+			main::errhandle_log_*|main::log_*|main::profile_*|main::complete|main::check_default|main::step_ready|main::add_step)
+				continue
+			;;
+			main::get_metadata|main::barrier_*|hdb::wait_for_media_part|hdb::host_added)
+				continue
+			;;
+		esac
+		eval "$(declare -f "${fn}" | sed "1s/^${fn} /__profiled_${fn} /")"
+		eval "${fn}() { main::profile_call ${fn} \"\${@}\"; }"
+	done
+}
+
+
+main::profile_call() {
+	local __profile_fn=${1}
+	shift
+	local __profile_start
+	local __profile_duration
+	local __profile_self
+	local __profile_rc
+
+	__profile_start=$(date +%s%6N)
+	PROFILE_DEPTH=$((PROFILE_DEPTH + 1))
+	PROFILE_CHILDREN[${PROFILE_DEPTH}]=0
+
+	"__profiled_${__profile_fn}" "${@}"
+	__profile_rc=$?
+
+	## self time excludes time spent in other profiled functions called from this one
+	__profile_duration=$(($(date +%s%6N) - __profile_start))
+	__profile_self=$((__profile_duration - PROFILE_CHILDREN[PROFILE_DEPTH]))
+	PROFILE_DEPTH=$((PROFILE_DEPTH - 1))
+	PROFILE_CHILDREN[${PROFILE_DEPTH}]=$((PROFILE_CHILDREN[PROFILE_DEPTH] + __profile_duration))
+
+	echo "{\"name\":\"${__profile_fn}\",\"cat\":\"${__profile_fn%%::*}\",\"ph\":\"X\",\"ts\":${__profile_start},\"dur\":${__profile_duration},\"pid\":1,\"tid\":${BASHPID},\"args\":{\"self_us\":${__profile_self}}}" >> "${PROFILE_EVENTS}"
+	return ${__profile_rc}
+}
+
+
+main::profile_report() {
+	local trace=/root/.deploy/${HOSTNAME}_deployment_trace.json
+	local line
+
+	if [[ ! -f "${PROFILE_EVENTS}" ]]; then
+		return 0
+	fi
+
+	## Chrome trace / Perfetto format. Open in chrome://tracing or ui.perfetto.dev
+	{
+		echo '{"traceEvents":['
+		paste -sd, "${PROFILE_EVENTS}"
+		echo ']}'
+	} > "${trace}"
+	main::errhandle_log_info "--- Deployment trace stored in ${trace}"
+
+	## main::run_steps is left out of the summary as its self time is spent waiting for background steps
+	main::errhandle_log_info "--- Slowest deployment steps on ${HOSTNAME} by self time:"
+	while read -r line; do
+		main::errhandle_log_info "------ ${line}"
+	done < <(awk -F'"' '$4 != "process_name" && $4 != "main::run_steps" { split($0, self, "\"self_us\":"); total[$4] += self[2] + 0; calls[$4]++ }
+		END { for (fn in total) printf "%.1f %s %d\n", total[fn] / 1000000, fn, calls[fn] }' "${PROFILE_EVENTS}" \
+		| sort -rn | head -10 | awk '{ printf "%s %ss (%d calls)\n", $2, $1, $3 }')
+
+	if [[ -n "${VM_METADATA[sap_hana_deployment_bucket]}" ]]; then
+		${GSUTIL} -q cp "${trace}" gs://"${VM_METADATA[sap_hana_deployment_bucket]}"/logs/
+	fi
+}
+
+
+main::share_libs() {
+	## share the verified library bundle with scale-out nodes, which load it from /hana/shared on their next boot
+	if [[ -n "${SAP_LIB_VERSION}" ]] && [[ -f /root/.deploy/lib/sap_lib-"${SAP_LIB_VERSION}".tar.gz ]]; then
+		main::errhandle_log_info "Sharing deployment library bundle ${SAP_LIB_VERSION} in /hana/shared/.deploy/lib"
+		mkdir -p /hana/shared/.deploy/lib
+		cp /root/.deploy/lib/sap_lib-"${SAP_LIB_VERSION}".tar.gz /hana/shared/.deploy/lib/
+	fi
+}
+
+
+main::publish_lib_version() {
+	local host
+	local pids=()
+	local pid
+
+	## scale-out workers wait in main::load_libs for the library version and checksum this node loaded
+	main::errhandle_log_info "Passing deployment library version ${SAP_LIB_VERSION} to ${*}"
+	for host in "${@}"; do
+		(
+			local count=0
+			while ! ${GCLOUD} --quiet compute instances add-metadata "${host}" --metadata "sap_lib_version=${SAP_LIB_VERSION},sap_lib_sha256=${SAP_LIB_SHA256}" >/dev/null 2>&1; do
+				## concurrent metadata updates of the same instance fail. Back off and try again
+				count=$((count +1))
+				if [[ ${count} -gt 10 ]]; then
+					main::errhandle_log_warning "--- Unable to pass the deployment library version to ${host}"
+					exit 1
+				fi
+				sleep $((RANDOM % 5 + 1))
+			done
+		) &
+		pids+=($!)
+	done
+
+	for pid in "${pids[@]}"; do
+		wait "${pid}"
+	done
+}
+
+
+main::image_prepared() {
+	local step=${1}
+
+	## images built by sap_image/build_image.sh list the deployment steps already applied to them
+	grep -q "^steps=.*\b${step}\b" /etc/sap-deploy-image 2>/dev/null
+}
+
+
+main::image_version() {
+	grep "^version=" /etc/sap-deploy-image 2>/dev/null | cut -d'=' -f2
+}
+
+
+main::prepare_image() {
+	local steps=${1}
+
+	main::errhandle_log_info "Finalizing prepared image"
+	{
+		echo "version=$(date -u +%Y%m%d%H%M%S)"
+		echo "source_image=$(main::get_metadata http://169.254.169.254/computeMetadata/v1/instance/image)"
+		echo "steps=${steps}"
+	} > /etc/sap-deploy-image
+
+	## remove anything specific to the build instance
+	rm -f /etc/hostname
+	rm -rf /root/.deploy/
+	main::errhandle_log_info "--- Image prepared with steps: ${steps}. Shutting down"
+	main::log_flush
+	shutdown -h now
+	exit 0
+}
+
+
 main::check_default() {
 	local default=${1}
 	local current=${2}
@@ -416,10 +1092,27 @@ main::get_metadata() {
 main::complete() {
   local on_error=${1}
 
+  ## steps run in the background by main::run_steps only end their own shell. 3 tells the runner to complete the deployment
+  if [[ "${BASHPID}" != "$$" ]]; then
+    if [[ -z "${on_error}" ]]; then
+      exit 3
+    fi
+    exit 1
+  fi
+
+  ## wait for background steps still running
+  if [[ ${#STEP_PIDS[@]} -gt 0 ]]; then
+    main::errhandle_log_info "--- Waiting for running steps to finish"
+    wait "${!STEP_PIDS[@]}"
+    STEP_PIDS=()
+  fi
+
   if [[ -z "${on_error}" ]]; then
   	main::errhandle_log_info "INSTANCE DEPLOYMENT COMPLETE"
   fi
 
+  main::profile_report
+
   ## prepare advanced logs
   if [[ "${VM_METADATA[sap_deployment_debug]}" = "True" ]]; then
     mkdir -p /root/.deploy
@@ -447,12 +1140,24 @@ main::complete() {
 		fi
 	fi
 
+	if [[ -f /root/.deploy/checkpoints/.skipped ]]; then
+		main::errhandle_log_info "--- Resumed from checkpoints in /root/.deploy/checkpoints. Skipped $(wc -l < /root/.deploy/checkpoints/.skipped) completed steps, saving $(awk '{ total += $1 } END { print total }' /root/.deploy/checkpoints/.skipped) seconds"
+		rm -f /root/.deploy/checkpoints/.skipped
+	fi
+
+	if [[ -f /root/.deploy/warnings_$$ ]]; then
+		deployment_warnings=$((${deployment_warnings:-0} + $(wc -l < /root/.deploy/warnings_$$)))
+		rm -f /root/.deploy/warnings_$$
+	fi
+
 	if [[ -z "${deployment_warnings}" ]]; then
 		main::errhandle_log_info "--- Finished"
 	else
 		main::errhandle_log_warning "--- Finished (${deployment_warnings} warnings)"
 	fi
 
+	main::log_flush
+
 	## exit sending right error code
 	if [[ -z "${on_error}" ]]; then
   	exit 0
@@ -103,8 +103,9 @@ nvm::config_hana() {
     fi 
   done
 
-  hdb::set_parameters global.ini persistence basepath_persistent_memory_volumes "${pmem_dev_list}"
-  hdb::set_parameters global.ini memorymanager persistent_memory_disable_linux_numa_mapping true
+  hdb::queue_parameters global.ini persistence basepath_persistent_memory_volumes "${pmem_dev_list}"
+  hdb::queue_parameters global.ini memorymanager persistent_memory_disable_linux_numa_mapping true
+  hdb::apply_parameters
 
   hdb::stop
   hdb::start
@@ -67,6 +67,10 @@ def GenerateConfig(context):
   sapmnt_size = context.properties['sapmntSize']
   sap_deployment_debug = str(context.properties.get('sap_deployment_debug', 'False')) 
   post_deployment_script = str(context.properties.get('post_deployment_script', ''))
+  sap_subnetwork = str(context.properties['subnetwork'])
+  package_cache = str(context.properties.get('package_cache', ''))
+  deployment_lib_version = str(context.properties.get('deployment_lib_version', ''))
+  deployment_lib_sha256 = str(context.properties.get('deployment_lib_sha256', ''))
   other_host = str(context.properties.get('otherHost',''))
   swap_size = context.properties['swapSize']
 
@@ -295,6 +299,22 @@ def GenerateConfig(context):
                       'key': 'startup-script',
                       'value': primary_startup_url
                   },
+                  {
+                      'key': 'sap_subnetwork',
+                      'value': sap_subnetwork
+                  },
+                  {
+                      'key': 'sap_package_cache',
+                      'value': package_cache
+                  },
+                  {
+                      'key': 'sap_lib_version',
+                      'value': deployment_lib_version
+                  },
+                  {
+                      'key': 'sap_lib_sha256',
+                      'value': deployment_lib_sha256
+                  },
                   {
                       'key': 'post_deployment_script',
                       'value': post_deployment_script
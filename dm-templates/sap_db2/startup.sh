@@ -25,30 +25,36 @@ else
 fi
 
 ## Import includes
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_main.sh)"
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_db2.sh)"
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_nw.sh)"
+if [[ ! -s /root/.deploy/lib/sap_lib_load.sh ]]; then
+  mkdir -p /root/.deploy/lib
+  curl -s --fail "${DEPLOY_URL}"/lib/sap_lib_load.sh -o /root/.deploy/lib/sap_lib_load.sh
+fi
+source /root/.deploy/lib/sap_lib_load.sh
+main::load_libs main db2 nw
+
+## Time every deployment step. The trace is stored in /root/.deploy when the deployment completes
+main::profile_functions
 
 ### Base GCP and OS Configuration
 main::get_os_version
 main::install_gsdk /usr/local
-main::set_boot_parameters
-main::install_packages
-main::config_ssh
+main::checkpoint main::set_boot_parameters
+main::checkpoint main::install_packages
+main::checkpoint main::config_ssh
 main::get_settings
-main::create_static_ip
+main::checkpoint main::create_static_ip
 
 ## Prepare for DB2
-db2::fix_services
-db2::create_filesystems
+main::checkpoint db2::fix_services
+main::checkpoint db2::create_filesystems
 
 if [[ -n "${VM_METADATA[other_host]}" ]]; then
   main::install_ssh_key "${VM_METADATA[other_host]}"
 fi
 
 ## Prepare for NetWeaver
-nw::install_agent
-nw::create_filesystems
+main::checkpoint nw::install_agent
+main::checkpoint nw::create_filesystems
 
 ## Clean up
 main::complete
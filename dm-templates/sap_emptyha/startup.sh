@@ -24,22 +24,30 @@ else
 fi
 
 ## Import includes
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_main.sh)"
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_ha.sh)"
+if [[ ! -s /root/.deploy/lib/sap_lib_load.sh ]]; then
+  mkdir -p /root/.deploy/lib
+  curl -s --fail "${DEPLOY_URL}"/lib/sap_lib_load.sh -o /root/.deploy/lib/sap_lib_load.sh
+fi
+source /root/.deploy/lib/sap_lib_load.sh
+main::load_libs main ha
+
+## Time every deployment step. The trace is stored in /root/.deploy when the deployment completes
+main::profile_functions
 
 ### Base GCP and OS Configuration
 main::get_os_version
 main::install_gsdk /usr/local
-main::set_boot_parameters
-main::install_packages
-main::config_ssh
+main::checkpoint main::set_boot_parameters
+main::checkpoint main::install_packages
+main::checkpoint main::config_ssh
 main::get_settings
-main::create_static_ip
+main::checkpoint main::create_static_ip
 
 ## Setup HA
 ha::check_settings
 ha::install_secondary_sshkeys
 ha::download_scripts
+ha::set_corosync_timing
 ha::ready
 ha::config_pacemaker_primary
 ha::check_cluster
@@ -61,10 +61,20 @@ def GenerateConfig(context):
   sap_hana_sapsys_gid = str(context.properties.get('sap_hana_sapsys_gid', '79'))
   sap_hana_scaleout_nodes = int(context.properties.get('sap_hana_scaleout_nodes', ''))
   sap_hana_deployment_bucket =  str(context.properties.get('sap_hana_deployment_bucket', ''))
+  sap_hana_extract_components = str(context.properties.get('sap_hana_extract_components', ''))
+  sap_hana_media_cache = str(context.properties.get('sap_hana_media_cache', ''))
+  sap_hana_backint_tune = str(context.properties.get('sap_hana_backint_tune', 'False'))
+  sap_hana_backint_tune_size = str(context.properties.get('sap_hana_backint_tune_size', '256'))
+  sap_hana_log_backup_staging = str(context.properties.get('sap_hana_log_backup_staging', 'False'))
+  sap_hana_log_upload_parallel = str(context.properties.get('sap_hana_log_upload_parallel', '4'))
   sap_hana_double_volume_size = str(context.properties.get('sap_hana_double_volume_size', 'False')) 
   sap_hana_backup_size = int(context.properties.get('sap_hana_backup_size', '0'))
   sap_deployment_debug = str(context.properties.get('sap_deployment_debug', 'False')) 
   post_deployment_script = str(context.properties.get('post_deployment_script', ''))
+  sap_subnetwork = str(context.properties['subnetwork'])
+  package_cache = str(context.properties.get('package_cache', ''))
+  deployment_lib_version = str(context.properties.get('deployment_lib_version', ''))
+  deployment_lib_sha256 = str(context.properties.get('deployment_lib_sha256', ''))
 
   # Subnetwork: with SharedVPC support
   if "/" in context.properties['subnetwork']:
@@ -183,10 +193,50 @@ def GenerateConfig(context):
                       'key': 'startup-script',
                       'value': primary_startup_url
                   },
+                  {
+                      'key': 'sap_subnetwork',
+                      'value': sap_subnetwork
+                  },
+                  {
+                      'key': 'sap_package_cache',
+                      'value': package_cache
+                  },
+                  {
+                      'key': 'sap_lib_version',
+                      'value': deployment_lib_version
+                  },
+                  {
+                      'key': 'sap_lib_sha256',
+                      'value': deployment_lib_sha256
+                  },
                   {
                       'key': 'sap_hana_deployment_bucket',
                       'value': sap_hana_deployment_bucket
                   },
+                  {
+                      'key': 'sap_hana_extract_components',
+                      'value': sap_hana_extract_components
+                  },
+                  {
+                      'key': 'sap_hana_media_cache',
+                      'value': sap_hana_media_cache
+                  },
+                  {
+                      'key': 'sap_hana_backint_tune',
+                      'value': sap_hana_backint_tune
+                  },
+                  {
+                      'key': 'sap_hana_backint_tune_size',
+                      'value': sap_hana_backint_tune_size
+                  },
+                  {
+                      'key': 'sap_hana_log_backup_staging',
+                      'value': sap_hana_log_backup_staging
+                  },
+                  {
+                      'key': 'sap_hana_log_upload_parallel',
+                      'value': sap_hana_log_upload_parallel
+                  },
                   {
                       'key': 'sap_deployment_debug',
                       'value': sap_deployment_debug
@@ -297,10 +347,54 @@ def GenerateConfig(context):
                               'key': 'startup-script',
                               'value': secondary_startup_url
                           },
+                          {
+                              'key': 'sap_subnetwork',
+                              'value': sap_subnetwork
+                          },
+                          {
+                              'key': 'sap_package_cache',
+                              'value': package_cache
+                          },
+                          {
+                              'key': 'sap_lib_version',
+                              'value': deployment_lib_version
+                          },
+                          {
+                              'key': 'sap_lib_sha256',
+                              'value': deployment_lib_sha256
+                          },
+                          {
+                              'key': 'sap_lib_master',
+                              'value': context.properties['instanceName']
+                          },
                           {
                               'key': 'sap_hana_deployment_bucket',
                               'value': sap_hana_deployment_bucket
                           },
+                          {
+                              'key': 'sap_hana_extract_components',
+                              'value': sap_hana_extract_components
+                          },
+                          {
+                              'key': 'sap_hana_media_cache',
+                              'value': sap_hana_media_cache
+                          },
+                          {
+                              'key': 'sap_hana_backint_tune',
+                              'value': sap_hana_backint_tune
+                          },
+                          {
+                              'key': 'sap_hana_backint_tune_size',
+                              'value': sap_hana_backint_tune_size
+                          },
+                          {
+                              'key': 'sap_hana_log_backup_staging',
+                              'value': sap_hana_log_backup_staging
+                          },
+                          {
+                              'key': 'sap_hana_log_upload_parallel',
+                              'value': sap_hana_log_upload_parallel
+                          },
                           {
                               'key': 'post_deployment_script',
                               'value': post_deployment_script
@@ -25,38 +25,53 @@ else
 fi
 
 ## Import includes
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_main.sh)"
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_hdb.sh)"
+if [[ ! -s /root/.deploy/lib/sap_lib_load.sh ]]; then
+  mkdir -p /root/.deploy/lib
+  curl -s --fail "${DEPLOY_URL}"/lib/sap_lib_load.sh -o /root/.deploy/lib/sap_lib_load.sh
+fi
+source /root/.deploy/lib/sap_lib_load.sh
+main::load_libs main hdb
+
+## Time every deployment step. The trace is stored in /root/.deploy when the deployment completes
+main::profile_functions
 
-### Base GCP and OS Configuration
+### Base GCP and OS Configuration. Boot parameters may reboot the instance so they're set before anything else
 main::get_os_version
 main::install_gsdk /usr/local
-main::set_boot_parameters
-main::install_packages
-main::config_ssh
-main::get_settings
-main::create_static_ip
+main::checkpoint main::set_boot_parameters
+
+## Steps are run as soon as the steps producing their inputs have completed
+## name                     inputs                                    outputs          command
+main::add_step packages     ""                                        "packages"       main::checkpoint main::install_packages
+main::add_step ssh          ""                                        "ssh"            main::checkpoint main::config_ssh
+main::add_step -f settings  ""                                        "settings"       main::get_settings
+main::add_step static_ip    "settings"                                "static_ip"      main::checkpoint main::create_static_ip
 
 ##prepare for SAP HANA
-hdb::check_settings
-hdb::set_kernel_parameters
-hdb::calculate_volume_sizes
-hdb::create_shared_volume
-hdb::create_sap_data_log_volumes
-hdb::create_backup_volume
+main::add_step -f hana_settings "settings"                            "hana_settings"  hdb::check_settings
+main::add_step kernel       "packages hana_settings"                  "kernel"         main::checkpoint hdb::set_kernel_parameters
+main::add_step -f sizes     "hana_settings"                           "sizes"          hdb::calculate_volume_sizes
+main::add_step shared       "packages sizes"                          "shared"         main::checkpoint hdb::create_shared_volume
+main::add_step data_log     "shared"                                  "data_log"       main::checkpoint hdb::create_sap_data_log_volumes
+main::add_step backup       "packages"                                "backup"         main::checkpoint hdb::create_backup_volume
 
 ## scaleout config
-hdb::install_worker_sshkeys
-hdb::config_nfs
+main::add_step worker_keys  "ssh hana_settings"                       "worker_keys"    hdb::install_worker_sshkeys
+main::add_step nfs          "packages shared backup hana_settings"    "nfs"            main::checkpoint hdb::config_nfs
+main::add_step share_libs   "shared"                                  "share_libs"     main::share_libs
+main::add_step lib_version  "hana_settings"                           "lib_version"    hdb::publish_lib_version
 
 ## Install SAP HANA
-hdb::create_install_cfg
-hdb::download_media
-hdb::extract_media
-hdb::install
-hdb::upgrade
-hdb::config_backup
-hdb::install_scaleout_nodes
+main::add_step install_cfg  "hana_settings"                           "install_cfg"    main::checkpoint hdb::create_install_cfg
+main::add_step -f media_number "hana_settings"                        "media_number"   hdb::get_media_number
+main::add_step download     "shared media_number"                     "media"          hdb::download_media
+main::add_step extract      "media_number packages shared"            "extracted"      main::checkpoint hdb::extract_media
+main::add_step install      "media extracted install_cfg data_log kernel" "hana"           main::checkpoint hdb::install
+main::add_step cache_media  "extracted"                               "media_cached"   hdb::cache_media
+main::add_step upgrade      "hana"                                    "hana_upgraded"  main::checkpoint hdb::upgrade
+main::add_step config_backup "hana_upgraded backup"                   "backup_config"  main::checkpoint hdb::config_backup
+main::add_step scaleout     "backup_config worker_keys nfs static_ip" "scaleout"       hdb::install_scaleout_nodes
+main::run_steps
 
 ## Post deployment & installation cleanup
 main::complete
@@ -25,24 +25,39 @@ else
 fi
 
 ## Import includes
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_main.sh)"
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_hdb.sh)"
+if [[ ! -s /root/.deploy/lib/sap_lib_load.sh ]]; then
+  mkdir -p /root/.deploy/lib
+  curl -s --fail "${DEPLOY_URL}"/lib/sap_lib_load.sh -o /root/.deploy/lib/sap_lib_load.sh
+fi
+source /root/.deploy/lib/sap_lib_load.sh
+main::load_libs main hdb
+
+## Time every deployment step. The trace is stored in /root/.deploy when the deployment completes
+main::profile_functions
 
 ### Base GCP and OS Configuration
 main::get_os_version
 main::install_gsdk /usr/local
-main::set_boot_parameters
-main::install_packages
-main::config_ssh
+main::checkpoint main::set_boot_parameters
+main::checkpoint main::install_packages
+main::checkpoint main::config_ssh
 main::get_settings
-main::create_static_ip
+main::checkpoint main::create_static_ip
 
 ## prepare for SAP HANA
 hdb::check_settings
-hdb::set_kernel_parameters
+if ! main::barrier_arrive booted "${hana_master_node}"; then
+  main::errhandle_log_warning "--- ${hana_master_node} will only add its SSH key to this host after its 10 minute wait"
+fi
+main::checkpoint hdb::set_kernel_parameters
 hdb::calculate_volume_sizes worker
-hdb::create_sap_data_log_volumes
+main::checkpoint hdb::create_sap_data_log_volumes
 hdb::mount_nfs
 
+## Signal hdb::install_scaleout_nodes on the master that this worker can be added
+if ! main::barrier_arrive worker_ready "${hana_master_node}"; then
+  main::errhandle_log_warning "--- ${hana_master_node} will only add this host after its 20 minute wait"
+fi
+
 ## Post deployment & installation cleanup
 main::complete
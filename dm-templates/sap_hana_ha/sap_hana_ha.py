@@ -61,11 +61,28 @@ def GenerateConfig(context):
   sap_hana_sapsys_gid = str(context.properties.get('sap_hana_sapsys_gid', '79'))
   sap_vip = str(context.properties.get('sap_vip', ''))
   sap_vip_secondary_range = str(context.properties.get('sap_vip_secondary_range', ''))
+  sap_vip_solution = str(context.properties.get('sap_vip_solution', 'ALIAS')).upper()
+  sap_vip_healthcheck_port = str(context.properties.get('sap_vip_healthcheck_port', '60000'))
+  sap_failover_profile = str(context.properties.get('sap_failover_profile', 'balanced'))
+  sap_failover_agent_latency = str(context.properties.get('sap_failover_agent_latency', ''))
   sap_hana_deployment_bucket =  str(context.properties.get('sap_hana_deployment_bucket', ''))
+  sap_hana_extract_components = str(context.properties.get('sap_hana_extract_components', ''))
+  sap_hana_media_cache = str(context.properties.get('sap_hana_media_cache', ''))
+  sap_hana_backint_tune = str(context.properties.get('sap_hana_backint_tune', 'False'))
+  sap_hana_backint_tune_size = str(context.properties.get('sap_hana_backint_tune_size', '256'))
+  sap_hana_log_backup_staging = str(context.properties.get('sap_hana_log_backup_staging', 'False'))
+  sap_hana_log_upload_parallel = str(context.properties.get('sap_hana_log_upload_parallel', '4'))
+  sap_hana_hsr_seed = str(context.properties.get('sap_hana_hsr_seed', 'False'))
+  sap_hana_backup_mode = str(context.properties.get('sap_hana_backup_mode', 'file'))
   sap_hana_double_volume_size = str(context.properties.get('sap_hana_double_volume_size', 'False')) 
   sap_hana_backup_size = int(context.properties.get('sap_hana_backup_size', '0'))
   sap_deployment_debug = str(context.properties.get('sap_deployment_debug', 'False')) 
   post_deployment_script = str(context.properties.get('post_deployment_script', ''))
+  sap_subnetwork = str(context.properties['subnetwork'])
+  package_cache = str(context.properties.get('package_cache', ''))
+  deployment_lib_version = str(context.properties.get('deployment_lib_version', ''))
+  deployment_lib_sha256 = str(context.properties.get('deployment_lib_sha256', ''))
+  sap_hana_replication_subnetwork = str(context.properties.get('replicationSubnetwork', ''))
 
   # Subnetwork: with SharedVPC support
   if "/" in context.properties['subnetwork']:
@@ -83,6 +100,22 @@ def GenerateConfig(context):
         'type': 'ONE_TO_ONE_NAT'
       }]
 
+  network_interfaces = [{
+      'accessConfigs': networking,
+      'subnetwork': subnetwork
+      }]
+
+  # Replication subnetwork: optional second NIC dedicated to SAP HANA System Replication
+  if sap_hana_replication_subnetwork:
+      if "/" in sap_hana_replication_subnetwork:
+          sharedvpc = sap_hana_replication_subnetwork.split("/")
+          replication_subnetwork = RegionalComputeUrl(sharedvpc[0], region, 'subnetworks', sharedvpc[1])
+      else:
+          replication_subnetwork = RegionalComputeUrl(project, region, 'subnetworks', sap_hana_replication_subnetwork)
+      network_interfaces.append({
+          'subnetwork': replication_subnetwork
+          })
+
   # set startup URL
   if sap_deployment_debug == "True":
       primary_startup_url = primary_startup_url.replace(" -s ", " -x -s ")
@@ -178,10 +211,58 @@ def GenerateConfig(context):
                       'key': 'startup-script',
                       'value': primary_startup_url
                   },
+                  {
+                      'key': 'sap_subnetwork',
+                      'value': sap_subnetwork
+                  },
+                  {
+                      'key': 'sap_package_cache',
+                      'value': package_cache
+                  },
+                  {
+                      'key': 'sap_lib_version',
+                      'value': deployment_lib_version
+                  },
+                  {
+                      'key': 'sap_lib_sha256',
+                      'value': deployment_lib_sha256
+                  },
                   {
                       'key': 'sap_hana_deployment_bucket',
                       'value': sap_hana_deployment_bucket
                   },
+                  {
+                      'key': 'sap_hana_extract_components',
+                      'value': sap_hana_extract_components
+                  },
+                  {
+                      'key': 'sap_hana_media_cache',
+                      'value': sap_hana_media_cache
+                  },
+                  {
+                      'key': 'sap_hana_backint_tune',
+                      'value': sap_hana_backint_tune
+                  },
+                  {
+                      'key': 'sap_hana_backint_tune_size',
+                      'value': sap_hana_backint_tune_size
+                  },
+                  {
+                      'key': 'sap_hana_log_backup_staging',
+                      'value': sap_hana_log_backup_staging
+                  },
+                  {
+                      'key': 'sap_hana_log_upload_parallel',
+                      'value': sap_hana_log_upload_parallel
+                  },
+                  {
+                      'key': 'sap_hana_hsr_seed',
+                      'value': sap_hana_hsr_seed
+                  },
+                  {
+                      'key': 'sap_hana_backup_mode',
+                      'value': sap_hana_backup_mode
+                  },
                   {
                       'key': 'sap_deployment_debug',
                       'value': sap_deployment_debug
@@ -237,6 +318,26 @@ def GenerateConfig(context):
                   {
                       'key': 'sap_vip_secondary_range',
                       'value': sap_vip_secondary_range
+                  },
+                  {
+                      'key': 'sap_hana_replication_subnetwork',
+                      'value': sap_hana_replication_subnetwork
+                  },
+                  {
+                      'key': 'sap_vip_solution',
+                      'value': sap_vip_solution
+                  },
+                  {
+                      'key': 'sap_vip_healthcheck_port',
+                      'value': sap_vip_healthcheck_port
+                  },
+                  {
+                      'key': 'sap_failover_profile',
+                      'value': sap_failover_profile
+                  },
+                  {
+                      'key': 'sap_failover_agent_latency',
+                      'value': sap_failover_agent_latency
                   }]
               },
               "tags": network_tags,
@@ -276,10 +377,7 @@ def GenerateConfig(context):
                       'https://www.googleapis.com/auth/devstorage.read_write'
                       ]
                   }],
-              'networkInterfaces': [{
-                  'accessConfigs': networking,
-                    'subnetwork': subnetwork
-                  }]
+              'networkInterfaces': network_interfaces
               }
 
           })
@@ -319,10 +417,58 @@ def GenerateConfig(context):
                       'key': 'startup-script',
                       'value': secondary_startup_url
                   },
+                  {
+                      'key': 'sap_subnetwork',
+                      'value': sap_subnetwork
+                  },
+                  {
+                      'key': 'sap_package_cache',
+                      'value': package_cache
+                  },
+                  {
+                      'key': 'sap_lib_version',
+                      'value': deployment_lib_version
+                  },
+                  {
+                      'key': 'sap_lib_sha256',
+                      'value': deployment_lib_sha256
+                  },
                   {
                       'key': 'sap_hana_deployment_bucket',
                       'value': sap_hana_deployment_bucket
                   },
+                  {
+                      'key': 'sap_hana_extract_components',
+                      'value': sap_hana_extract_components
+                  },
+                  {
+                      'key': 'sap_hana_media_cache',
+                      'value': sap_hana_media_cache
+                  },
+                  {
+                      'key': 'sap_hana_backint_tune',
+                      'value': sap_hana_backint_tune
+                  },
+                  {
+                      'key': 'sap_hana_backint_tune_size',
+                      'value': sap_hana_backint_tune_size
+                  },
+                  {
+                      'key': 'sap_hana_log_backup_staging',
+                      'value': sap_hana_log_backup_staging
+                  },
+                  {
+                      'key': 'sap_hana_log_upload_parallel',
+                      'value': sap_hana_log_upload_parallel
+                  },
+                  {
+                      'key': 'sap_hana_hsr_seed',
+                      'value': sap_hana_hsr_seed
+                  },
+                  {
+                      'key': 'sap_hana_backup_mode',
+                      'value': sap_hana_backup_mode
+                  },
                   {
                       'key': 'sap_deployment_debug',
                       'value': sap_deployment_debug
@@ -378,6 +524,26 @@ def GenerateConfig(context):
                   {
                       'key': 'sap_vip_secondary_range',
                       'value': sap_vip_secondary_range
+                  },
+                  {
+                      'key': 'sap_hana_replication_subnetwork',
+                      'value': sap_hana_replication_subnetwork
+                  },
+                  {
+                      'key': 'sap_vip_solution',
+                      'value': sap_vip_solution
+                  },
+                  {
+                      'key': 'sap_vip_healthcheck_port',
+                      'value': sap_vip_healthcheck_port
+                  },
+                  {
+                      'key': 'sap_failover_profile',
+                      'value': sap_failover_profile
+                  },
+                  {
+                      'key': 'sap_failover_agent_latency',
+                      'value': sap_failover_agent_latency
                   }]
               },
               "tags": network_tags,
@@ -417,11 +583,84 @@ def GenerateConfig(context):
                       'https://www.googleapis.com/auth/devstorage.read_write'
                       ]
                   }],
-              'networkInterfaces': [{
-                  'accessConfigs': networking,
-                    'subnetwork': subnetwork
-                  }]
+              'networkInterfaces': network_interfaces
           }
     })
 
+  ## internal load balancer fronting the virtual IP
+  if sap_vip_solution == "ILB":
+      ilb_name = primary_instance_name + '-ilb'
+
+      hana_nodes.append({
+          'name': ilb_name + '-hc',
+          'type': 'compute.v1.healthCheck',
+          'properties': {
+              'type': 'TCP',
+              'tcpHealthCheck': {
+                  'port': int(sap_vip_healthcheck_port)
+                  },
+              'checkIntervalSec': 2,
+              'timeoutSec': 2,
+              'healthyThreshold': 2,
+              'unhealthyThreshold': 2
+              }
+          })
+
+      ilb_backends = []
+      for ilb_instance, ilb_zone in ((primary_instance_name, primary_zone), (secondary_instance_name, secondary_zone)):
+          hana_nodes.append({
+              'name': ilb_instance + '-ig',
+              'type': 'compute.v1.instanceGroup',
+              'properties': {
+                  'zone': ilb_zone
+                  }
+              })
+
+          hana_nodes.append({
+              'name': ilb_instance + '-ig-members',
+              'action': 'gcp-types/compute-v1:compute.instanceGroups.addInstances',
+              'properties': {
+                  'project': project,
+                  'zone': ilb_zone,
+                  'instanceGroup': ilb_instance + '-ig',
+                  'instances': [{
+                      'instance': ''.join(['$(ref.', ilb_instance, '.selfLink)'])
+                      }]
+                  },
+              'metadata': {
+                  'dependsOn': [ilb_instance + '-ig', ilb_instance],
+                  'runtimePolicy': ['CREATE']
+                  }
+              })
+
+          ilb_backends.append({
+              'group': ''.join(['$(ref.', ilb_instance + '-ig', '.selfLink)'])
+              })
+
+      hana_nodes.append({
+          'name': ilb_name + '-bs',
+          'type': 'compute.v1.regionBackendService',
+          'properties': {
+              'region': region,
+              'loadBalancingScheme': 'INTERNAL',
+              'protocol': 'TCP',
+              'healthChecks': [''.join(['$(ref.', ilb_name + '-hc', '.selfLink)'])],
+              'backends': ilb_backends
+              }
+          })
+
+      hana_nodes.append({
+          'name': ilb_name,
+          'type': 'compute.v1.forwardingRule',
+          'properties': {
+              'region': region,
+              'loadBalancingScheme': 'INTERNAL',
+              'IPAddress': sap_vip,
+              'IPProtocol': 'TCP',
+              'allPorts': True,
+              'subnetwork': subnetwork,
+              'backendService': ''.join(['$(ref.', ilb_name + '-bs', '.selfLink)'])
+              }
+          })
+
   return {'resources': hana_nodes}
@@ -25,34 +25,41 @@ else
 fi
 
 ## Import includes
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_main.sh)"
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_hdb.sh)"
-source /dev/stdin <<< "$(curl -s ${DEPLOY_URL}/lib/sap_lib_ha.sh)"
+if [[ ! -s /root/.deploy/lib/sap_lib_load.sh ]]; then
+  mkdir -p /root/.deploy/lib
+  curl -s --fail "${DEPLOY_URL}"/lib/sap_lib_load.sh -o /root/.deploy/lib/sap_lib_load.sh
+fi
+source /root/.deploy/lib/sap_lib_load.sh
+main::load_libs main hdb ha
+
+## Time every deployment step. The trace is stored in /root/.deploy when the deployment completes
+main::profile_functions
 
 ### Base main:: and OS Configuration
 main::get_os_version
 main::install_gsdk /usr/local
-main::set_boot_parameters
-main::install_packages
-main::config_ssh
+main::checkpoint main::set_boot_parameters
+main::checkpoint main::install_packages
+main::checkpoint main::config_ssh
 main::get_settings
-main::create_static_ip
+main::checkpoint main::create_static_ip
 
 ##prepare for SAP HANA
 hdb::check_settings
-hdb::set_kernel_parameters
+main::checkpoint hdb::set_kernel_parameters
 hdb::calculate_volume_sizes
-hdb::create_shared_volume
-hdb::create_sap_data_log_volumes
-hdb::create_backup_volume
+main::checkpoint hdb::create_shared_volume
+main::checkpoint hdb::create_sap_data_log_volumes
+main::checkpoint hdb::create_backup_volume
 
 ## Install SAP HANA
-hdb::create_install_cfg
+main::checkpoint hdb::create_install_cfg
 hdb::download_media
-hdb::extract_media
-hdb::install
-hdb::upgrade
-hdb::config_backup
+main::checkpoint hdb::extract_media
+hdb::cache_media
+main::checkpoint hdb::install
+main::checkpoint hdb::upgrade
+main::checkpoint hdb::config_backup
 
 ## Setup HA
 ha::check_settings
@@ -61,7 +68,10 @@ ha::download_scripts
 ha::create_hdb_user
 ha::hdbuserstore
 hdb::backup /hanabackup/data/pre_ha_config
+ha::config_hsr_network
 ha::enable_hsr
+ha::create_hsr_seed
+ha::set_corosync_timing
 ha::ready
 ha::config_pacemaker_primary
 ha::check_cluster
@@ -71,6 +81,7 @@ ha::pacemaker_add_vip
 ha::pacemaker_config_bootstrap_hdb
 ha::pacemaker_add_hana
 ha::check_hdb_replication
+ha::close_hsr_seed
 ha::pacemaker_maintenance false
 
 ## Post deployment & installation cleanup
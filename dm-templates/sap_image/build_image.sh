@@ -0,0 +1,94 @@
+#!/bin/bash
+# ------------------------------------------------------------------------
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Description:  Google Cloud Platform - Build a prepared image for SAP deployments
+# Build Date:   Sat Oct 19 12:00:00 GMT 2019
+# ------------------------------------------------------------------------
+#
+# Creates a temporary instance from a public SLES/RHEL for SAP image, applies the
+# operating system steps the deployment templates would otherwise run on every
+# instance, and stores the result as a new image in a custom image family.
+# Set linuxImage to family/[FAMILY] and linuxImageProject to your project in any
+# of the Linux templates to use it.
+#
+# Usage: build_image.sh -f [FAMILY] -i [SOURCE_IMAGE_FAMILY] -p [SOURCE_IMAGE_PROJECT] -z [ZONE]
+#                       [-w hana|nw] [-u DEPLOYMENT_SCRIPT_LOCATION]
+#
+# e.g. build_image.sh -f sles-12-sp4-sap-hana-prepared -i sles-12-sp4-sap -p suse-sap-cloud -z us-central1-f
+
+set -e
+
+usage() {
+  sed -n '/^# Usage/,/^$/p' "${0}" | sed 's/^# \{0,1\}//'
+  exit 1
+}
+
+workload=hana
+deploy_url="https://storage.googleapis.com/sapdeploy/dm-templates"
+
+while getopts "f:i:p:z:w:u:" opt; do
+  case ${opt} in
+    f) family=${OPTARG} ;;
+    i) source_family=${OPTARG} ;;
+    p) source_project=${OPTARG} ;;
+    z) zone=${OPTARG} ;;
+    w) workload=${OPTARG} ;;
+    u) deploy_url=${OPTARG} ;;
+    *) usage ;;
+  esac
+done
+
+if [[ -z "${family}" ]] || [[ -z "${source_family}" ]] || [[ -z "${source_project}" ]] || [[ -z "${zone}" ]]; then
+  usage
+fi
+
+if [[ ! "${workload}" =~ ^(hana|nw)$ ]]; then
+  echo "ERROR - workload must be hana or nw"
+  exit 1
+fi
+
+## image names are versioned so existing deployments keep a fixed image while the family moves on
+version=$(date -u +%Y%m%d%H%M%S)
+image="${family}-v${version}"
+builder="${family:0:40}-build-${version}"
+
+echo "INFO - Creating build instance ${builder} from ${source_project}/${source_family}"
+gcloud compute instances create "${builder}" --zone "${zone}" \
+  --machine-type n1-standard-4 --boot-disk-size 30GB \
+  --image-family "${source_family}" --image-project "${source_project}" \
+  --scopes cloud-platform \
+  --metadata "sap_image_workload=${workload},startup-script=curl ${deploy_url}/sap_image/startup.sh | bash -s ${deploy_url}"
+
+## the build instance shuts itself down once the image is prepared
+echo "INFO - Waiting for ${builder} to finish preparing the image"
+count=0
+until [[ "$(gcloud compute instances describe "${builder}" --zone "${zone}" --format='value(status)')" = "TERMINATED" ]]; do
+  sleep 30
+  count=$((count +1))
+  if [[ ${count} -gt 120 ]]; then
+    echo "ERROR - ${builder} did not finish within an hour. Check its serial console output for errors"
+    exit 1
+  fi
+done
+
+echo "INFO - Creating image ${image} in family ${family}"
+gcloud compute images create "${image}" --family "${family}" \
+  --source-disk "${builder}" --source-disk-zone "${zone}" \
+  --description "SAP ${workload} prepared image built from ${source_project}/${source_family}"
+
+echo "INFO - Removing build instance ${builder}"
+gcloud --quiet compute instances delete "${builder}" --zone "${zone}"
+
+echo "INFO - Finished. Use linuxImage: family/${family} with linuxImageProject: $(gcloud config get-value project 2>/dev/null)"
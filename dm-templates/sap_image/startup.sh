@@ -0,0 +1,47 @@
+#!/bin/bash
+# ------------------------------------------------------------------------
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Description:  Google Cloud Platform - SAP Prepared Image Build
+# Build Date:   Sat Oct 19 12:00:00 GMT 2019
+# ------------------------------------------------------------------------
+
+## Check to see if a custom script path was provieded by the template
+if [[ "${1}" ]]; then
+  readonly DEPLOY_URL="${1}"
+else
+  readonly DEPLOY_URL="https://storage.googleapis.com/sapdeploy/dm-templates"
+fi
+
+## Import includes
+if [[ ! -s /root/.deploy/lib/sap_lib_load.sh ]]; then
+  mkdir -p /root/.deploy/lib
+  curl -s --fail "${DEPLOY_URL}"/lib/sap_lib_load.sh -o /root/.deploy/lib/sap_lib_load.sh
+fi
+source /root/.deploy/lib/sap_lib_load.sh
+main::load_libs main hdb
+
+### Base GCP and OS Configuration. The instance reboots once after the boot parameters are set and this script runs again
+main::get_os_version
+main::install_gsdk /usr/local
+main::set_boot_parameters
+main::install_packages
+
+## HANA kernel parameters and tuned/saptune profile are only applied to images for HANA
+if [[ "$(main::get_metadata sap_image_workload)" = "nw" ]]; then
+  main::prepare_image "gsdk boot_parameters packages"
+else
+  hdb::set_kernel_parameters
+  main::prepare_image "gsdk boot_parameters packages kernel_parameters"
+fi
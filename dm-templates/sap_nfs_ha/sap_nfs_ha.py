@@ -55,9 +55,17 @@ def GenerateConfig(context):
   ## Get deployment template specific variables from context
   sap_vip = str(context.properties.get('sap_vip', ''))
   sap_vip_secondary_range = str(context.properties.get('sap_vip_secondary_range', ''))
+  sap_vip_solution = str(context.properties.get('sap_vip_solution', 'ALIAS')).upper()
+  sap_vip_healthcheck_port = str(context.properties.get('sap_vip_healthcheck_port', '60000'))
+  sap_failover_profile = str(context.properties.get('sap_failover_profile', 'balanced'))
+  sap_failover_agent_latency = str(context.properties.get('sap_failover_agent_latency', ''))
   nfs_vol_size = int(context.properties.get('nfsVolSize', '10'))
   sap_deployment_debug = str(context.properties.get('sap_deployment_debug', 'False')) 
   post_deployment_script = str(context.properties.get('post_deployment_script', ''))
+  sap_subnetwork = str(context.properties['subnetwork'])
+  package_cache = str(context.properties.get('package_cache', ''))
+  deployment_lib_version = str(context.properties.get('deployment_lib_version', ''))
+  deployment_lib_sha256 = str(context.properties.get('deployment_lib_sha256', ''))
 
   # Subnetwork: with SharedVPC support
   if "/" in context.properties['subnetwork']:
@@ -106,6 +114,22 @@ def GenerateConfig(context):
                       'key': 'startup-script',
                       'value': primary_startup_url
                   },
+                  {
+                      'key': 'sap_subnetwork',
+                      'value': sap_subnetwork
+                  },
+                  {
+                      'key': 'sap_package_cache',
+                      'value': package_cache
+                  },
+                  {
+                      'key': 'sap_lib_version',
+                      'value': deployment_lib_version
+                  },
+                  {
+                      'key': 'sap_lib_sha256',
+                      'value': deployment_lib_sha256
+                  },
                   {
                       'key': 'sap_primary_instance',
                       'value': primary_instance_name
@@ -137,6 +161,22 @@ def GenerateConfig(context):
                   {
                       'key': 'sap_vip_secondary_range',
                       'value': sap_vip_secondary_range
+                  },
+                  {
+                      'key': 'sap_vip_solution',
+                      'value': sap_vip_solution
+                  },
+                  {
+                      'key': 'sap_vip_healthcheck_port',
+                      'value': sap_vip_healthcheck_port
+                  },
+                  {
+                      'key': 'sap_failover_profile',
+                      'value': sap_failover_profile
+                  },
+                  {
+                      'key': 'sap_failover_agent_latency',
+                      'value': sap_failover_agent_latency
                   }]
               },
               "tags": network_tags,
@@ -202,6 +242,22 @@ def GenerateConfig(context):
                       'key': 'startup-script',
                       'value': secondary_startup_url
                   },
+                  {
+                      'key': 'sap_subnetwork',
+                      'value': sap_subnetwork
+                  },
+                  {
+                      'key': 'sap_package_cache',
+                      'value': package_cache
+                  },
+                  {
+                      'key': 'sap_lib_version',
+                      'value': deployment_lib_version
+                  },
+                  {
+                      'key': 'sap_lib_sha256',
+                      'value': deployment_lib_sha256
+                  },
                   {
                       'key': 'sap_primary_instance',
                       'value': primary_instance_name
@@ -233,6 +289,22 @@ def GenerateConfig(context):
                   {
                       'key': 'sap_vip_secondary_range',
                       'value': sap_vip_secondary_range
+                  },
+                  {
+                      'key': 'sap_vip_solution',
+                      'value': sap_vip_solution
+                  },
+                  {
+                      'key': 'sap_vip_healthcheck_port',
+                      'value': sap_vip_healthcheck_port
+                  },
+                  {
+                      'key': 'sap_failover_profile',
+                      'value': sap_failover_profile
+                  },
+                  {
+                      'key': 'sap_failover_agent_latency',
+                      'value': sap_failover_agent_latency
                   }]
               },
               "tags": network_tags,
@@ -273,4 +345,80 @@ def GenerateConfig(context):
           }
     })
 
+  ## internal load balancer fronting the virtual IP
+  if sap_vip_solution == "ILB":
+      ilb_name = primary_instance_name + '-ilb'
+
+      nfs_nodes.append({
+          'name': ilb_name + '-hc',
+          'type': 'compute.v1.healthCheck',
+          'properties': {
+              'type': 'TCP',
+              'tcpHealthCheck': {
+                  'port': int(sap_vip_healthcheck_port)
+                  },
+              'checkIntervalSec': 2,
+              'timeoutSec': 2,
+              'healthyThreshold': 2,
+              'unhealthyThreshold': 2
+              }
+          })
+
+      ilb_backends = []
+      for ilb_instance, ilb_zone in ((primary_instance_name, primary_zone), (secondary_instance_name, secondary_zone)):
+          nfs_nodes.append({
+              'name': ilb_instance + '-ig',
+              'type': 'compute.v1.instanceGroup',
+              'properties': {
+                  'zone': ilb_zone
+                  }
+              })
+
+          nfs_nodes.append({
+              'name': ilb_instance + '-ig-members',
+              'action': 'gcp-types/compute-v1:compute.instanceGroups.addInstances',
+              'properties': {
+                  'project': project,
+                  'zone': ilb_zone,
+                  'instanceGroup': ilb_instance + '-ig',
+                  'instances': [{
+                      'instance': ''.join(['$(ref.', ilb_instance, '.selfLink)'])
+                      }]
+                  },
+              'metadata': {
+                  'dependsOn': [ilb_instance + '-ig', ilb_instance],
+                  'runtimePolicy': ['CREATE']
+                  }
+              })
+
+          ilb_backends.append({
+              'group': ''.join(['$(ref.', ilb_instance + '-ig', '.selfLink)'])
+              })
+
+      nfs_nodes.append({
+          'name': ilb_name + '-bs',
+          'type': 'compute.v1.regionBackendService',
+          'properties': {
+              'region': region,
+              'loadBalancingScheme': 'INTERNAL',
+              'protocol': 'TCP',
+              'healthChecks': [''.join(['$(ref.', ilb_name + '-hc', '.selfLink)'])],
+              'backends': ilb_backends
+              }
+          })
+
+      nfs_nodes.append({
+          'name': ilb_name,
+          'type': 'compute.v1.forwardingRule',
+          'properties': {
+              'region': region,
+              'loadBalancingScheme': 'INTERNAL',
+              'IPAddress': sap_vip,
+              'IPProtocol': 'TCP',
+              'allPorts': True,
+              'subnetwork': subnetwork,
+              'backendService': ''.join(['$(ref.', ilb_name + '-bs', '.selfLink)'])
+              }
+          })
+
   return {'resources': nfs_nodes}
@@ -20,9 +20,18 @@
 readonly METADATA_URL="http://169.254.169.254/computeMetadata/v1"
 #IP address used to avoid potential resolution issues with custom DNS / hosts files
 
+load_metadata() {
+  # Fetch all instance metadata (attributes, zone & alias IPs) in a single recursive read
+  local key
+  local value
+  declare -g -A METADATA
+  while read -r key value; do
+    METADATA[${key}]=${value}
+  done < <(curl --fail -sH'Metadata-Flavor: Google' "${METADATA_URL}/instance/?recursive=true&alt=text")
+}
+
 get_metadata() {
-  output=$(curl --fail -sH'Metadata-Flavor: Google' ${METADATA_URL}/instance/attributes/$1)
-  echo $output
+  echo "${METADATA[attributes/$1]}"
 }
 
 get_virtual_ip() {
@@ -54,7 +63,7 @@ get_route_name() {
   # Check if metadata key exists
   ROUTE_NAME=$(get_metadata sap_ibm_db2_routename)
   ROUTE_NETWORK=$(get_metadata sap_ibm_db2_routenet)
-  if [[ (-z ROUTE_NAME) || (-z ROUTE_NETWORK) ]]; then
+  if [[ (-z ${ROUTE_NAME}) || (-z ${ROUTE_NETWORK}) ]]; then
     log_error "IP route network or route name not set in metadata. This is required."
     #exit 1 will be triggered from main program
     ROUTE_NAME=""
@@ -71,24 +80,43 @@ get_cluster_hosts() {
   HOSTS=($(lsrpnode -d | awk -F ':' 'FNR>1 { print $1 }'))
 }
 
-get_zone() {
-  ZONE=$(${GCLOUDCMD} --quiet compute instances list --filter="name=('${1}')" --format 'csv[no-heading](zone)')
+get_hosts_aliases() {
+  # Resolve the zone and alias IP ranges of every cluster host in a single API call
+  local filter
+  local name
+  local zone
+  local aliases
+  declare -g -A HOST_ZONE
+  declare -g -A HOST_ALIASES
+  filter=$(printf "'%s' " "${HOSTS[@]}")
+  while IFS='|' read -r name zone aliases; do
+    HOST_ZONE[${name}]=${zone}
+    HOST_ALIASES[${name}]=${aliases}
+  done < <(${GCLOUDCMD} --quiet compute instances list --filter="name=(${filter})" --format="value[separator='|'](name,zone.basename(),networkInterfaces[0].aliasIpRanges[].ipCidrRange.join(','))")
 }
 
-get_ip() {
-  IP=$(${GCLOUDCMD} --quiet compute instances describe ${1} --zone ${ZONE} --format text | grep aliasIpRanges | grep ${VIRTUAL_IP} | awk '{ print $2 }')
+remove_alias() {
+  # Remove all alias IPs from a host. gcloud waits for the operation to complete, retry on fingerprint conflicts
+  local host=${1}
+  local zone=${2}
+  local attempt
+  for attempt in 1 2 3 4 5; do
+    if ${GCLOUDCMD} --quiet beta compute instances network-interfaces update ${host} --zone ${zone} --aliases ""; then
+      log_info "Removed all alias IP addresses from ${host}"
+      return 0
+    fi
+    log_info "Removing alias IP addresses from ${host} failed (attempt ${attempt}). Trying again"
+  done
+  log_error "Unable to remove alias IP addresses from ${host}"
+  return 1
 }
 
 get_my_zone() {
-  MYZONE=$(curl -sH'Metadata-Flavor: Google' "${METADATA_URL}/instance/zone" | cut -d'/' -f4)
+  MYZONE=${METADATA[zone]##*/}
 }
 
 get_my_ip() {
-  if [[ $(curl -sH'Metadata-Flavor: Google' "${METADATA_URL}/instance/network-interfaces/0/ip-aliases/") ]]; then
-    MYIP=$(curl -sH'Metadata-Flavor: Google' "${METADATA_URL}/instance/network-interfaces/0/ip-aliases/0")
-  else
-    unset MYIP
-  fi
+  MYIP=${METADATA[network-interfaces/0/ip-aliases/0]}
 }
 
 get_gcloud() {
@@ -144,6 +172,8 @@ OPSTATE_PENDOFF=6
 OPSTATE_INELIG=8
 
 #Primary parameters
+load_metadata
+
 #Solution=alias (intra-zonal HA using IP alias) or routing (inter-zonal HA routing priority)
 SOLUTION=$(get_metadata sap_ibm_vip_solution)
 if [[ -z ${SOLUTION} ]]; then
@@ -180,33 +210,35 @@ case ${ACTION} in
         exit 1
       fi
       get_alias_range
-      ## If I already have the IP, exit. If it has an alias IP that isn't the VIP, then remove it
+      ## If I already have the IP, exit. Any other alias IP on this host is replaced when the VIP is added
       if [[ -n ${MYIP} ]]; then
         if [[ ${MYIP} == ${VIRTUAL_IP} ]]; then
           log_info "${HOSTNAME} already has ${MYIP} attached. No action required"
           # Set alias on eth0, since it may be allocated to the instance but not the device
           assign_ip_host
           exit 0
-        else
-          log_info "Removing ${MYIP} from ${HOSTNAME}"
-          ${GCLOUDCMD} --quiet beta compute instances network-interfaces update ${HOSTNAME} --zone ${MYZONE} --aliases ""
         fi
       fi
 
-      ## Loops through all hosts & remove the alias IP from the host that has it
+      ## Remove the alias IP from every other host that has it, concurrently
       #May need to revise as this could wipe other valid alias assignments in complex scenarios
-      IP="TBD"
+      get_hosts_aliases
+      PIDS=()
       for HOST in "${HOSTS[@]}"; do
-        get_zone ${HOST}
-        get_ip ${HOST}
-        log_info "Checking to see if ${HOST} owns ${VIRTUAL_IP}"
-        ## keep trying to remove until it's not there anymore - Added due to the fingerprint bug
-        while [[ -n ${IP} ]]; do
-          log_info "${IP} is attached to ${HOST} - Removing all alias IP addresses from ${HOST}"
-          ${GCLOUDCMD} --quiet beta compute instances network-interfaces update ${HOST} --zone ${ZONE} --aliases ""
-          get_ip ${HOST}
-          sleep 2
-        done
+        if [[ ${HOST} == ${HOSTNAME} ]]; then
+          continue
+        fi
+        if [[ ,${HOST_ALIASES[${HOST}]}, == *,${VIRTUAL_IP},* ]]; then
+          log_info "${VIRTUAL_IP} is attached to ${HOST} - Removing all alias IP addresses from ${HOST}"
+          remove_alias ${HOST} ${HOST_ZONE[${HOST}]} &
+          PIDS+=($!)
+        fi
+      done
+      for PID in "${PIDS[@]}"; do
+        if ! wait ${PID}; then
+          log_error "${VIRTUAL_IP} is still attached to another host. Cannot start resource."
+          exit 1
+        fi
       done
 
       ## add alias IP to localhost